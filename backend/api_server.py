@@ -1,13 +1,27 @@
-from fastapi import FastAPI, HTTPException, Request, Depends, Body
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.routing import Match
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
+import orjson
 import uuid
 import os
-from datetime import datetime, timedelta
+import glob
+import math
+import time
+import tempfile
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST
+import container_index as index
+import streams
+import metrics
 
-app = FastAPI(root_path="/api")
+app = FastAPI(root_path="/api", default_response_class=ORJSONResponse)
 
 # === DO NOT CHANGE CORS ===
 allowed_origins_str = os.getenv(
@@ -26,42 +40,301 @@ app.add_middleware(
 
 #Redis Setup
 redis_host = os.getenv("REDIS_HOST", "localhost")
+redis_port = int(os.getenv("REDIS_PORT", "6379"))
 redis_password = os.getenv("REDIS_PASSWORD")
-
-try:
-    r = redis.Redis(
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "200"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))  # wait for a free connection
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5"))  # seconds a /health ping is reused
+
+# Serving: API_WORKERS processes, each with its own Redis pool (so the
+# server holds up to API_WORKERS * REDIS_MAX_CONNECTIONS connections)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+r: aioredis.Redis = None  # created on startup, one pool per process
+prune_expired = None  # container index scripts, registered on startup
+list_page = None
+rate_limit_script = None
+create_script = None
+delete_script = None
+create_batch_script = None
+delete_batch_script = None
+
+ADMIT_INVALID_CAPTCHA = -1
+ADMIT_QUOTA_EXCEEDED = -2
+
+# KEYS: ratelimit:{ip}
+# ARGV: limit, window (ms), cost, unique request id
+# Sliding-window log: one sorted-set member per counted request, scored by
+# server time in ms. Trims, counts and (if there is room) records the
+# request atomically, so concurrent requests can't all read the same count
+# and there is no 2x burst at a window boundary.
+# Returns {allowed, remaining, ms until the oldest request leaves the window}.
+RATE_LIMIT_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local allowed = 0
+if count + cost <= limit then
+    allowed = 1
+    for i = 1, cost do
+        redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+    end
+    count = count + cost
+    if cost > 0 then
+        redis.call('PEXPIRE', KEYS[1], window)
+    end
+end
+local reset = 0
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+return {allowed, limit - count, reset}
+"""
+
+# KEYS: captcha, container hash, events stream, status stream, version,
+#       index, active status sets (pending first), every status set (for pruning)
+# ARGV: id, name, image, created_at, now, ttl, max containers,
+#       number of active status sets, status stream maxlen
+# The whole create admission path: consume the one-time CAPTCHA, prune
+# expired ids, check the quota, append the command and write the pending
+# container. Running it as one script makes the MAX_CONTAINERS check exact
+# under concurrency, and the worker can never see the event before the hash.
+# The new container is also announced on the status stream so live clients
+# see it without polling. The command stream is not trimmed here: the worker
+# trims it below what its consumer group still needs (see main.py).
+# Returns {1, event id}, {-1} for a bad CAPTCHA or {-2, active count}.
+CREATE_CONTAINER_LUA = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return {-1}
+end
+local now = tonumber(ARGV[5])
+local n_active = tonumber(ARGV[8])
+if #redis.call('ZRANGEBYSCORE', KEYS[6], '-inf', now, 'LIMIT', 0, 1) > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[6], '-inf', now)
+    for i = 7 + n_active, #KEYS do
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    end
+    redis.call('INCR', KEYS[5])
+end
+local active = 0
+for i = 7, 6 + n_active do
+    active = active + redis.call('ZCARD', KEYS[i])
+end
+if active >= tonumber(ARGV[7]) then
+    return {-2, active}
+end
+local event_id = redis.call('XADD', KEYS[3], '*',
+    'event_type', 'container_created', 'container_id', ARGV[1],
+    'name', ARGV[2], 'image', ARGV[3], 'created_at', ARGV[4])
+local expires = now + tonumber(ARGV[6])
+redis.call('HSET', KEYS[2], 'id', ARGV[1], 'name', ARGV[2], 'image', ARGV[3],
+    'status', 'pending', 'created_at', ARGV[4])
+redis.call('EXPIREAT', KEYS[2], math.ceil(expires))
+redis.call('ZADD', KEYS[6], expires, ARGV[1])
+redis.call('ZADD', KEYS[7], expires, ARGV[1])
+redis.call('INCR', KEYS[5])
+redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[9], '*',
+    'event_type', 'container_status_update', 'container_id', ARGV[1],
+    'status', 'pending', 'name', ARGV[2], 'image', ARGV[3],
+    'created_at', ARGV[4], 'timestamp', ARGV[5])
+return {1, event_id}
+"""
+
+# KEYS: captcha, container hash, events stream
+# ARGV: id, deleted_at
+# Returns {existed, event id} or {-1} for a bad CAPTCHA.
+DELETE_CONTAINER_LUA = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return {-1}
+end
+local existed = redis.call('EXISTS', KEYS[2])
+local event_id = redis.call('XADD', KEYS[3], '*',
+    'event_type', 'container_deleted', 'container_id', ARGV[1],
+    'deleted_at', ARGV[2])
+return {existed, event_id}
+"""
+
+# KEYS: captcha, status stream, version, index, active status sets (pending
+#       first), every status set, one hash per container, then the command
+#       stream of every partition the batch touches
+# ARGV: batch id, containers JSON ([{id, name, image, created_at}]), now,
+#       ttl, max containers, number of active status sets, number of status
+#       sets, status stream maxlen, then each partition's containers JSON
+# CREATE_CONTAINER_LUA for a whole set: the quota is reserved for every
+# container or none, and each partition gets a single containers_created
+# command.
+# Returns {1, first event id}, {-1} for a bad CAPTCHA or {-2, active count}.
+CREATE_BATCH_LUA = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return {-1}
+end
+local now = tonumber(ARGV[3])
+local n_active = tonumber(ARGV[6])
+local first_hash = 5 + n_active + tonumber(ARGV[7])
+if #redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', now, 'LIMIT', 0, 1) > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now)
+    for i = 5 + n_active, first_hash - 1 do
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+    end
+    redis.call('INCR', KEYS[3])
+end
+local containers = cjson.decode(ARGV[2])
+local active = 0
+for i = 5, 4 + n_active do
+    active = active + redis.call('ZCARD', KEYS[i])
+end
+if active + #containers > tonumber(ARGV[5]) then
+    return {-2, active}
+end
+local first_stream = first_hash + #containers
+local event_id
+for i = first_stream, #KEYS do
+    local id = redis.call('XADD', KEYS[i], '*',
+        'event_type', 'containers_created', 'batch_id', ARGV[1],
+        'containers', ARGV[9 + i - first_stream])
+    event_id = event_id or id
+end
+local expires = now + tonumber(ARGV[4])
+for i, c in ipairs(containers) do
+    local key = KEYS[first_hash + i - 1]
+    redis.call('HSET', key, 'id', c.id, 'name', c.name, 'image', c.image,
+        'status', 'pending', 'created_at', c.created_at, 'batch_id', ARGV[1])
+    redis.call('EXPIREAT', key, math.ceil(expires))
+    redis.call('ZADD', KEYS[4], expires, c.id)
+    redis.call('ZADD', KEYS[5], expires, c.id)
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[8], '*',
+        'event_type', 'container_status_update', 'container_id', c.id,
+        'status', 'pending', 'name', c.name, 'image', c.image,
+        'created_at', c.created_at, 'timestamp', ARGV[3])
+end
+redis.call('INCR', KEYS[3])
+return {1, event_id}
+"""
+
+# KEYS: captcha, one hash per container, then the command stream of every
+# partition the batch touches
+# ARGV: number of containers, deleted_at, then each partition's container ids JSON
+# Returns {first event id, {existed per container}} or {-1} for a bad CAPTCHA.
+DELETE_BATCH_LUA = """
+if redis.call('DEL', KEYS[1]) == 0 then
+    return {-1}
+end
+local n = tonumber(ARGV[1])
+local existed = {}
+for i = 2, 1 + n do
+    existed[#existed + 1] = redis.call('EXISTS', KEYS[i])
+end
+local event_id
+for i = 2 + n, #KEYS do
+    local id = redis.call('XADD', KEYS[i], '*',
+        'event_type', 'containers_deleted', 'container_ids', ARGV[3 + i - 2 - n],
+        'deleted_at', ARGV[2])
+    event_id = event_id or id
+end
+return {event_id, existed}
+"""
+
+# KEYS: sorted set to page through
+# ARGV: cursor score (inclusive), page size
+# Over-fetches by the number of ids sharing the cursor score so the caller
+# can skip the ones it already returned and still fill a page.
+LIST_PAGE_LUA = """
+local ties = 0
+if ARGV[1] ~= '-inf' then
+    ties = redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+end
+return redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf', 'WITHSCORES',
+                  'LIMIT', 0, tonumber(ARGV[2]) + 1 + ties)
+"""
+
+
+def create_redis():
+    """Build the pooled asyncio Redis client used by every handler"""
+    pool = aioredis.BlockingConnectionPool(
         host=redis_host,
-        port=6379,
+        port=redis_port,
         db=0,
         password=redis_password,
-        socket_connect_timeout=50,
-        socket_timeout=50,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
         retry_on_timeout=True,
+        health_check_interval=30,
         decode_responses=True  # Automatically decode responses to str
     )
-    r.ping()
-    print(f"✓ Connected to Redis at {redis_host}")
-except redis.ConnectionError as e:
-    print(f"✗ Failed to connect to Redis at {redis_host}: {e}")
-    raise
+    return aioredis.Redis(connection_pool=pool)
+
+
+@app.on_event("startup")
+async def connect_redis():
+    global r, prune_expired, list_page, rate_limit_script, create_script, delete_script
+    global create_batch_script, delete_batch_script
+    r = create_redis()
+    prune_expired = r.register_script(index.PRUNE_EXPIRED_LUA)
+    list_page = r.register_script(LIST_PAGE_LUA)
+    rate_limit_script = r.register_script(RATE_LIMIT_LUA)
+    create_script = r.register_script(CREATE_CONTAINER_LUA)
+    delete_script = r.register_script(DELETE_CONTAINER_LUA)
+    create_batch_script = r.register_script(CREATE_BATCH_LUA)
+    delete_batch_script = r.register_script(DELETE_BATCH_LUA)
+    try:
+        await r.ping()
+        print(f"✓ Connected to Redis at {redis_host} (pool size {REDIS_MAX_CONNECTIONS})")
+    except redis.ConnectionError as e:
+        print(f"✗ Failed to connect to Redis at {redis_host}: {e}")
+        raise
+
+
+@app.on_event("shutdown")
+async def close_redis():
+    await status_feed.stop()
+    if r is not None:
+        await r.aclose()
+        print("✓ Redis connection pool closed")
 
 # Security Config 
-MAX_CONTAINERS = 3
-RATE_LIMIT_REQUESTS = 100
-RATE_LIMIT_WINDOW = 900  # 15 minutes in seconds
+MAX_CONTAINERS = int(os.getenv("MAX_CONTAINERS", "3"))
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "900"))  # 15 minutes in seconds
 API_KEY = os.getenv("API_KEY", "demo123")  # Change in production!
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "20"))  # containers per batch request
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 1000
+LIST_CACHE_SIZE = int(os.getenv("LIST_CACHE_SIZE", "256"))  # cached listing pages per process
+SSE_READ_BLOCK_MS = 2000  # must stay below REDIS_SOCKET_TIMEOUT
+SSE_KEEPALIVE = 15  # seconds between comment frames on an idle stream
+SSE_QUEUE_SIZE = 100  # buffered updates per client before it is dropped
 
 #  Helper: Rate Limiting 
-def rate_limit(ip: str, max_req: int = RATE_LIMIT_REQUESTS, window: int = RATE_LIMIT_WINDOW):
-    key = f"ratelimit:{ip}"
-    current = r.get(key)
-    if current is None:
-        r.setex(key, window, 1)
-        return True
-    elif int(current) < max_req:
-        r.incr(key)
-        return True
-    return False
+async def rate_limit(ip: str, max_req: int = RATE_LIMIT_REQUESTS, window: int = RATE_LIMIT_WINDOW, cost: int = 1):
+    """
+    Sliding-window limiter, one round-trip per call.
+    Returns (allowed, remaining, reset_in_seconds); cost=0 only reads.
+    """
+    with metrics.redis_timer("rate_limit"):
+        allowed, remaining, reset_ms = await rate_limit_script(
+            keys=[f"ratelimit:{ip}"],
+            args=[max_req, window * 1000, cost, uuid.uuid4().hex]
+        )
+    return bool(allowed), max(0, int(remaining)), -(-int(reset_ms) // 1000)
+
+# Helper: Conditional Requests
+def not_modified(request: Request, etag: str):
+    """True if the client's If-None-Match already names this ETag"""
+    tags = request.headers.get("if-none-match")
+    if not tags:
+        return False
+    return tags.strip() == "*" or etag in [t.strip() for t in tags.split(",")]
 
 # Helper: API Key Check
 def require_api_key(request: Request):
@@ -75,15 +348,15 @@ def require_api_key(request: Request):
 async def request_captcha():
     """Frontend calls this to get a fresh CAPTCHA token"""
     token = str(uuid.uuid4())
-    r.setex(f"captcha:{token}", 300, "valid")  # 5-minute expiry
+    await r.setex(f"captcha:{token}", 300, "valid")  # 5-minute expiry
     return {"captcha_token": token}
 
 @app.post("/captcha/verify/{token}")
 async def verify_captcha(token: str):
     """Verify CAPTCHA token (called by frontend after slider)"""
     key = f"captcha:{token}"
-    if r.get(key):
-        r.delete(key)  
+    if await r.get(key):
+        await r.delete(key)  
         return {"verified": True}
     raise HTTPException(status_code=400, detail="Invalid or expired CAPTCHA token")
 
@@ -104,15 +377,68 @@ async def add_rate_limit(request: Request, call_next):
             return await call_next(request)
 
         # Enforce rate limit
-        if not rate_limit(client_ip, max_req=RATE_LIMIT_REQUESTS, window=RATE_LIMIT_WINDOW):
-            raise HTTPException(
+        allowed, remaining, reset_in_seconds = await rate_limit(
+            client_ip, max_req=RATE_LIMIT_REQUESTS, window=RATE_LIMIT_WINDOW
+        )
+        request.state.rate_limit = (remaining, reset_in_seconds)
+        headers = {
+            "X-RateLimit-Limit": str(RATE_LIMIT_REQUESTS),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset_in_seconds),
+        }
+        if not allowed:
+            metrics.RATE_LIMIT_REJECTIONS.inc()
+            return ORJSONResponse(
                 status_code=429,
-                detail=f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW//60} minutes."
+                content={"detail": f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW//60} minutes."},
+                headers={**headers, "Retry-After": str(reset_in_seconds)}
             )
 
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+    response = await call_next(request)
+    return response
+
+def route_template(request: Request):
+    """The matched route's path template; never the raw path, ids would explode cardinality"""
+    route = request.scope.get("route")
+    if route is None:
+        # Answered before routing (e.g. a 429), so match it ourselves
+        for candidate in app.router.routes:
+            if candidate.matches(request.scope)[0] == Match.FULL:
+                route = candidate
+                break
+    return route.path if route else "unmatched"
+
+# Request latency per route, outermost so 429s are counted too
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
     response = await call_next(request)
+    metrics.REQUEST_LATENCY.labels(
+        request.method, route_template(request), response.status_code
+    ).observe(time.perf_counter() - start)
     return response
 
+# Prometheus scrape target (served on the pod port, outside /api)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            for stream in streams.COMMAND_STREAMS:
+                pipe.xlen(stream)
+                pipe.xinfo_groups(stream)
+            replies = await pipe.execute(raise_on_error=False)
+        for i, stream in enumerate(streams.COMMAND_STREAMS):
+            length, groups = replies[2 * i:2 * i + 2]
+            if not isinstance(groups, Exception):  # no such stream until a worker creates it
+                metrics.record_stream(stream, length, groups)
+    except redis.RedisError as e:
+        print(f"✗ Could not read stream metrics: {e}")
+    return Response(metrics.exposition(), media_type=CONTENT_TYPE_LATEST)
+
 # New Endpoint: Get Rate Limit Status
 @app.get("/rate-limit")
 async def get_rate_limit(request: Request):
@@ -120,17 +446,16 @@ async def get_rate_limit(request: Request):
     Returns current rate limit usage for the client IP.
     Used by frontend to display remaining requests.
     """
-    client_ip = request.client.host
-    key = f"ratelimit:{client_ip}"
-    current = r.get(key)
-    ttl = r.ttl(key)
-
-    remaining = RATE_LIMIT_REQUESTS - (int(current) if current else 0)
-    reset_in_seconds = ttl if ttl > 0 else 0
+    # The middleware already ran the limiter for this request; reuse its answer
+    state = getattr(request.state, "rate_limit", None)
+    if state is None:
+        _, remaining, reset_in_seconds = await rate_limit(request.client.host, cost=0)
+    else:
+        remaining, reset_in_seconds = state
 
     return {
         "limit": RATE_LIMIT_REQUESTS,
-        "remaining": max(0, remaining),
+        "remaining": remaining,
         "reset_in_seconds": reset_in_seconds,
         "window": RATE_LIMIT_WINDOW,
         "namespace": "sprout"
@@ -145,65 +470,42 @@ async def create_container(
 ):
     """Create container only if CAPTCHA passed and under limit"""
     try:
-        r.ping()
+        container_id = str(uuid.uuid4())
+        created_at = datetime.utcnow().isoformat() + 'Z'
+        name = container.name if container and container.name else f"container-{container_id[:8]}"
+        image = container.image if container else "nginx:latest"
 
-        # 1. Verify CAPTCHA token
-        captcha_key = f"captcha:{captcha_token}"
-        if not r.get(captcha_key):
+        # Consume CAPTCHA, check + reserve quota, enqueue and store the
+        # pending container in one atomic round-trip
+        with metrics.redis_timer("create"):
+            result = await create_script(
+                keys=[
+                    f"captcha:{captcha_token}",
+                    index.container_key(container_id),
+                    streams.events_stream(container_id),
+                    streams.STATUS_STREAM,
+                    index.VERSION_KEY,
+                    index.INDEX_KEY,
+                    *index.ACTIVE_STATUS_KEYS,
+                    *index.STATUS_KEYS
+                ],
+                args=[
+                    container_id, name, image, created_at, time.time(),
+                    index.CONTAINER_TTL, MAX_CONTAINERS, len(index.ACTIVE_STATUS_KEYS),
+                    streams.STATUS_STREAM_MAXLEN
+                ]
+            )
+        if result[0] == ADMIT_INVALID_CAPTCHA:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid or expired CAPTCHA token. Please try again."
             )
-        r.delete(captcha_key)  # One-time use
-        print(f"✅ CAPTCHA token {captcha_token} verified and consumed")
-
-        # 2. Count running containers
-        container_keys = r.keys("container:*")
-        running_count = 0
-        for key in container_keys:
-            status = r.hget(key, "status")
-            if status in ["running", "pending"]:
-                running_count += 1
-
-        if running_count >= MAX_CONTAINERS:
+        if result[0] == ADMIT_QUOTA_EXCEEDED:
             raise HTTPException(
                 status_code=429,
-                detail=f"Too many containers running ({running_count}/{MAX_CONTAINERS}). Delete one first."
+                detail=f"Too many containers running ({result[1]}/{MAX_CONTAINERS}). Delete one first."
             )
-
-        # 3. Generate container
-        container_id = str(uuid.uuid4())
-        created_at = datetime.utcnow().isoformat() + 'Z'
-        name = container.name if container and container.name else f"container-{container_id[:8]}"
-        image = container.image if container else "nginx:latest"
-
-        # 4. Publish to Redis stream
-        event_id = r.xadd(
-            "container_events",
-            fields={
-                "event_type": "container_created",
-                "container_id": container_id,
-                "name": name,
-                "image": image,
-                "created_at": created_at
-            },
-            maxlen=1000
-        )
-
-        # 5. Store container state with TTL
-        container_key = f"container:{container_id}"
-        r.hset(
-            container_key,
-            mapping={
-                "id": container_id,
-                "name": name,
-                "image": image,
-                "status": "pending",
-                "created_at": created_at
-            }
-        )
-        r.expire(container_key, timedelta(hours=24))  # Auto cleanup
-
+        print(f"✅ CAPTCHA token {captcha_token} verified and consumed")
         print(f"✓ Created container {container_id}")
         return {
             "id": container_id,
@@ -224,6 +526,147 @@ async def create_container(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def by_partition(items, container_id_of, priority=False):
+    """{command stream: items} so each partition gets one command per batch"""
+    partitions = {}
+    for item in items:
+        partitions.setdefault(streams.events_stream(container_id_of(item), priority), []).append(item)
+    return partitions
+
+
+def batch_ids(ids):
+    """Validate and de-duplicate container ids for a batch, keeping their order"""
+    if not ids or len(ids) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {BATCH_MAX_SIZE} containers")
+    for container_id in ids:
+        try:
+            uuid.UUID(container_id)  # ids end up in a label selector
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid container id '{container_id}'")
+    return list(dict.fromkeys(ids))
+
+
+# Batch routes are declared before /containers/{container_id} so "batch"
+# is never taken for a container id
+
+# POST /containers/batch - Requires CAPTCHA Token
+@app.post("/containers/batch")
+async def create_containers(
+    containers: List[Container] = Body(..., embed=True),
+    api_key: str = Depends(require_api_key),
+    captcha_token: str = Body(..., embed=True)
+):
+    """Create several containers with one CAPTCHA; all of them fit under the limit or none is created"""
+    if not containers or len(containers) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {BATCH_MAX_SIZE} containers")
+    try:
+        batch_id = str(uuid.uuid4())
+        created_at = datetime.utcnow().isoformat() + 'Z'
+        items = []
+        for container in containers:
+            container_id = str(uuid.uuid4())
+            items.append({
+                "id": container_id,
+                "name": container.name or f"container-{container_id[:8]}",
+                "image": container.image,
+                "created_at": created_at
+            })
+
+        partitions = by_partition(items, lambda item: item["id"])
+        with metrics.redis_timer("create_batch"):
+            result = await create_batch_script(
+                keys=[
+                    f"captcha:{captcha_token}",
+                    streams.STATUS_STREAM,
+                    index.VERSION_KEY,
+                    index.INDEX_KEY,
+                    *index.ACTIVE_STATUS_KEYS,
+                    *index.STATUS_KEYS,
+                    *(index.container_key(item["id"]) for item in items),
+                    *partitions
+                ],
+                args=[
+                    batch_id, json.dumps(items), time.time(), index.CONTAINER_TTL, MAX_CONTAINERS,
+                    len(index.ACTIVE_STATUS_KEYS), len(index.STATUS_KEYS), streams.STATUS_STREAM_MAXLEN,
+                    *(json.dumps(group) for group in partitions.values())
+                ]
+            )
+        if result[0] == ADMIT_INVALID_CAPTCHA:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid or expired CAPTCHA token. Please try again."
+            )
+        if result[0] == ADMIT_QUOTA_EXCEEDED:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Not enough room for {len(items)} containers ({result[1]}/{MAX_CONTAINERS} in use)."
+            )
+        print(f"✓ Created batch {batch_id} with {len(items)} containers")
+        return {
+            "batch_id": batch_id,
+            "event_id": result[1],
+            "containers": [{**item, "status": "pending"} for item in items],
+            "namespace": "sprout"
+        }
+
+    except HTTPException:
+        raise
+    except redis.ConnectionError as e:
+        print(f"✗ Redis error: {e}")
+        raise HTTPException(status_code=503, detail="Redis service unavailable")
+    except Exception as e:
+        print(f"✗ Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# DELETE /containers/batch - Requires CAPTCHA Token
+@app.delete("/containers/batch")
+async def delete_containers(
+    ids: List[str] = Body(..., embed=True),
+    api_key: str = Depends(require_api_key),
+    captcha_token: str = Body(..., embed=True)
+):
+    """Delete several containers with one CAPTCHA and a single worker command"""
+    container_ids = batch_ids(ids)
+    try:
+        # Deletes free quota, so they skip ahead of queued creates
+        partitions = by_partition(container_ids, lambda container_id: container_id, priority=True)
+        with metrics.redis_timer("delete_batch"):
+            result = await delete_batch_script(
+                keys=[
+                    f"captcha:{captcha_token}",
+                    *(index.container_key(container_id) for container_id in container_ids),
+                    *partitions
+                ],
+                args=[
+                    len(container_ids), datetime.utcnow().isoformat(),
+                    *(json.dumps(group) for group in partitions.values())
+                ]
+            )
+        if result[0] == ADMIT_INVALID_CAPTCHA:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid or expired CAPTCHA token."
+            )
+        event_id, existed = result
+        return {
+            "message": f"Deletion of {len(container_ids)} containers requested",
+            "event_id": event_id,
+            "containers": [
+                {"id": container_id, "container_existed": bool(flag)}
+                for container_id, flag in zip(container_ids, existed)
+            ],
+            "namespace": "sprout"
+        }
+
+    except HTTPException:
+        raise
+    except redis.ConnectionError as e:
+        raise HTTPException(status_code=503, detail="Redis service unavailable")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete containers: {str(e)}")
+
+
 # DELETE /containers/{id} - Requires CAPTCHA Token 
 @app.delete("/containers/{container_id}")
 async def delete_container(
@@ -233,32 +676,23 @@ async def delete_container(
 ):
     """Delete container only if CAPTCHA token is valid"""
     try:
-        r.ping()
-
-        # 1. Verify CAPTCHA token
-        captcha_key = f"captcha:{captcha_token}"
-        if not r.get(captcha_key):
+        # Consume CAPTCHA and enqueue the deletion in one atomic round-trip
+        with metrics.redis_timer("delete"):
+            result = await delete_script(
+                keys=[
+                    f"captcha:{captcha_token}", index.container_key(container_id),
+                    streams.events_stream(container_id, priority=True)  # ahead of queued creates
+                ],
+                args=[container_id, datetime.utcnow().isoformat()]
+            )
+        if result[0] == ADMIT_INVALID_CAPTCHA:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid or expired CAPTCHA token."
             )
-        r.delete(captcha_key)  # One-time use
+        container_exists, event_id = result
         print(f"✅ CAPTCHA token {captcha_token} verified for deletion")
 
-        # 2. Proceed with deletion
-        container_key = f"container:{container_id}"
-        container_exists = r.exists(container_key)
-
-        event_id = r.xadd(
-            "container_events",
-            fields={
-                "event_type": "container_deleted",
-                "container_id": container_id,
-                "deleted_at": datetime.utcnow().isoformat()
-            },
-            maxlen=1000
-        )
-
         return {
             "message": f"Container {container_id} deletion requested",
             "event_id": event_id,
@@ -274,19 +708,109 @@ async def delete_container(
         raise HTTPException(status_code=500, detail=f"Failed to delete container: {str(e)}")
 
 
-#  GET /containers - List all containers 
+#  GET /containers - List containers, one page at a time
+# (limit, cursor, status, fields) -> (version, expires_at, body, next cursor)
+# Pages are valid while containers:version is unchanged and none of their
+# containers has reached its expiry score.
+list_cache = {}
+
+
+async def build_listing(limit, after_score, after_id, source, projection):
+    """Read one listing page from Redis and serialize it once"""
+    # Round-trip 1: prune expired ids, read the version and the page of ids.
+    # The version is read after pruning so it covers what was pruned.
+    async with r.pipeline(transaction=False) as pipe:
+        await prune_expired(keys=[index.VERSION_KEY, index.INDEX_KEY, *index.STATUS_KEYS], args=[time.time()], client=pipe)
+        pipe.get(index.VERSION_KEY)
+        await list_page(keys=[source], args=[after_score, limit], client=pipe)
+        with metrics.redis_timer("list_ids"):
+            _, version, rows = await pipe.execute()
+
+    page = []
+    for i in range(0, len(rows), 2):
+        container_id, score = rows[i], rows[i + 1]
+        if after_id and float(score) == float(after_score) and container_id <= after_id:
+            continue  # already returned on the previous page
+        page.append((container_id, score))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    # Round-trip 2: every hash on the page in one pipeline
+    async with r.pipeline(transaction=False) as pipe:
+        for container_id, _ in page:
+            if projection:
+                pipe.hmget(index.container_key(container_id), projection)
+            else:
+                pipe.hgetall(index.container_key(container_id))
+        with metrics.redis_timer("list_hashes"):
+            results = await pipe.execute()
+
+    containers = []
+    for data in results:
+        if projection:
+            data = {f: v for f, v in zip(projection, data) if v is not None}
+        if data:
+            data["namespace"] = "sprout"
+            containers.append(data)
+
+    next_cursor = None
+    if has_more and page:
+        last_id, last_score = page[-1]
+        next_cursor = f"{last_score}_{last_id}"
+    expires_at = min((float(score) for _, score in page), default=float("inf"))
+    return version or "0", expires_at, orjson.dumps(containers), next_cursor
+
+
 @app.get("/containers")
-async def list_containers():
+async def list_containers(
+    request: Request,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Lists containers oldest first. The next page's cursor is returned in
+    the X-Next-Cursor header; the header is absent on the last page.
+    `status` filters by container status and `fields` is a comma
+    separated projection (e.g. `fields=id,status`).
+    Responses carry an ETag; send it back in If-None-Match to get a 304
+    while nothing has changed.
+    """
+    if status is not None and status not in index.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status '{status}'")
+    after_score, after_id = "-inf", ""
+    if cursor:
+        try:
+            after_score, after_id = cursor.split("_", 1)
+            if not math.isfinite(float(after_score)):
+                raise ValueError(after_score)  # nan/inf would only fail inside Redis
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    cache_key = (limit, cursor, status, tuple(projection) if projection else None)
+
     try:
-        r.ping()
-        container_keys = r.keys("container:*")
-        containers = []
-        for key in container_keys:
-            data = r.hgetall(key)
-            if data:
-                data["namespace"] = "sprout"
-                containers.append(data)
-        return containers
+        # One GET decides whether the cached page is still current
+        with metrics.redis_timer("list_version"):
+            version = await r.get(index.VERSION_KEY) or "0"
+        cached = list_cache.get(cache_key)
+        if cached is None or cached[0] != version or cached[1] <= time.time():
+            source = index.status_key(status) if status else index.INDEX_KEY
+            cached = await build_listing(limit, after_score, after_id, source, projection)
+            list_cache.pop(cache_key, None)
+            if len(list_cache) >= LIST_CACHE_SIZE:
+                list_cache.pop(next(iter(list_cache)))  # oldest entry
+            list_cache[cache_key] = cached
+        version, _, body, next_cursor = cached
+
+        etag = f'W/"{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        if not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
     except redis.ConnectionError:
         raise HTTPException(status_code=503, detail="Redis unavailable")
     except Exception as e:
@@ -294,22 +818,129 @@ async def list_containers():
         return []
 
 
+# Live status feed
+class StatusFeed:
+    """
+    Follows STATUS_STREAM with one XREAD loop per process and hands every
+    entry to each subscribed client queue. The reader starts with the first
+    subscriber and stops after the last one leaves, so idle processes hold no
+    blocking connection and N clients cost one Redis read, not N polls.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def stop(self):
+        self.subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        last_id = "$"  # only updates published from now on
+        delay = 1
+        while self.subscribers:
+            # Any failure backs off and resumes after last_id; letting it end
+            # the task would leave clients with nothing but keepalives
+            try:
+                entries = await r.xread({streams.STATUS_STREAM: last_id}, count=100, block=SSE_READ_BLOCK_MS)
+                for _, messages in entries or []:
+                    for message_id, data in messages:
+                        last_id = message_id  # a bad entry is skipped, not reread
+                        self.broadcast(orjson.dumps({"id": message_id, **data}).decode())
+                delay = 1
+            except Exception as e:
+                print(f"✗ Status feed read failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def broadcast(self, payload):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream, EventSource reconnects
+                # and the client refetches the list
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+status_feed = StatusFeed()
+
+
+# GET /containers/events - Server-Sent Events stream of status changes
+@app.get("/containers/events")
+async def container_events(request: Request):
+    """
+    Pushes every container status change as an SSE `status` event whose
+    data is the JSON status entry. Clients should refetch /containers on
+    (re)connect and apply updates from here instead of polling.
+    """
+    queue = status_feed.subscribe()
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    break
+                yield f"event: status\ndata: {payload}\n\n"
+        finally:
+            status_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # Health Check 
+# Probes hit this every few seconds on every process; one ping per
+# HEALTH_CHECK_INTERVAL answers all of them
+health_state = {"checked_at": 0.0, "error": None}
+
+
 @app.get("/health")
 async def health_check():
-    try:
-        r.ping()
+    if time.monotonic() - health_state["checked_at"] >= HEALTH_CHECK_INTERVAL:
+        try:
+            await r.ping()
+            health_state["error"] = None
+        except Exception as e:
+            health_state["error"] = str(e)
+        health_state["checked_at"] = time.monotonic()
+    if health_state["error"] is None:
         return {"status": "healthy", "redis": "connected", "namespace": "sprout"}
-    except Exception as e:
-        return {"status": "unhealthy", "redis": "disconnected", "error": str(e)}
+    return {"status": "unhealthy", "redis": "disconnected", "error": health_state["error"]}
 
 
 # Debug: Container Info
 @app.get("/debug/container/{container_id}")
 async def debug_container(container_id: str):
     try:
-        r.ping()
-        data = r.hgetall(f"container:{container_id}")
+        data = await r.hgetall(f"container:{container_id}")
         redis_info = {k: v for k, v in data.items()} if data else None
         if redis_info:
             redis_info["namespace"] = "sprout"
@@ -326,10 +957,19 @@ async def debug_container(container_id: str):
 @app.get("/debug/stream")
 async def debug_stream():
     try:
-        r.ping()
-        info = r.xinfo_stream("container_events")
+        info = {}
+        for stream in streams.COMMAND_STREAMS:
+            try:
+                info[stream] = await r.xinfo_stream(stream)
+            except redis.ResponseError:
+                info[stream] = None  # no command written to this partition yet
+        try:
+            status_info = await r.xinfo_stream(streams.STATUS_STREAM)
+        except redis.ResponseError:
+            status_info = None  # no status published yet
         return {
-            "stream_info": info,
+            "stream_info": info[streams.EVENTS_STREAM] if len(info) == 1 else info,
+            "status_stream_info": status_info,
             "namespace": "sprout"
         }
     except Exception as e:
@@ -339,4 +979,12 @@ async def debug_stream():
 # Run Server 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if API_WORKERS > 1:
+        # Every process writes its metrics to files here and /metrics merges
+        # them; stale files from a previous run would be merged too
+        metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="sprout-metrics-"))
+        for stale in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(stale)
+        print(f"✓ Starting {API_WORKERS} worker processes (metrics in {metrics_dir})")
+    # Worker processes import the app themselves, so it is passed by name
+    uvicorn.run(app if API_WORKERS == 1 else "api_server:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""Load test for the API.
+
+Drives ``api_server.app`` in-process through httpx's ASGI transport, against
+a real Redis (``--redis-url``) or an in-process fakeredis stand-in (the
+default). Each scenario runs ``--requests`` calls at ``--concurrency`` and
+reports throughput and latency percentiles as JSON, so runs can be diffed.
+
+    python benchmarks/api_bench.py --concurrency 32 --requests 2000
+    python benchmarks/api_bench.py --redis-url redis://localhost:6379/15 --output before.json
+
+Scenarios:
+    captcha       POST /captcha/request
+    create        POST /containers (CAPTCHA tokens are minted outside the timing)
+    list          GET /containers over --containers seeded containers
+    list_cached   GET /containers with If-None-Match (the 304 path)
+    rate_limit    GET /rate-limit (limiter + handler)
+    rejected      any request from a client over its limit (the 429 path)
+    delete        DELETE /containers/{id} for the containers created above
+
+fakeredis numbers measure our own per-request overhead; a real Redis adds
+the network round-trips, which is what the script/pipeline work optimises.
+Point ``--redis-url`` at a scratch database: the run creates containers and
+the 'fake' default leaves nothing behind.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import httpx
+import api_server
+
+SCENARIOS = ("captcha", "create", "list", "list_cached", "rate_limit", "rejected", "delete")
+API_KEY_HEADER = {"X-API-Key": api_server.API_KEY}
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else None,
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "max": ms(ordered[-1]) if ordered else None,
+        },
+    }
+
+
+async def run(client, total, concurrency, make_request):
+    """
+    Issue ``total`` requests from ``concurrency`` tasks. make_request(i)
+    returns (method, url, kwargs); anything it needs but shouldn't be timed
+    is prepared there.
+    """
+    latencies, statuses = [], []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = await make_request(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - start)
+
+
+async def mint_captcha():
+    token = str(uuid.uuid4())
+    await api_server.r.setex(f"captcha:{token}", 300, "valid")
+    return token
+
+
+async def seed(client, count):
+    """Create containers through the API, outside any timing"""
+    ids = []
+    for _ in range(count):
+        response = await client.post(
+            "/containers", json={"captcha_token": await mint_captcha()}, headers=API_KEY_HEADER
+        )
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def bench(args):
+    if args.redis_url == "fake":
+        import fakeredis  # only needed for the in-process stand-in
+        server = fakeredis.FakeServer()
+        api_server.create_redis = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    else:
+        api_server.create_redis = lambda: api_server.aioredis.Redis.from_url(
+            args.redis_url, decode_responses=True, max_connections=api_server.REDIS_MAX_CONNECTIONS
+        )
+    # Lift the quotas so they don't end the run early; "rejected" lowers the limit on purpose
+    api_server.MAX_CONTAINERS = 10 ** 9
+    api_server.RATE_LIMIT_REQUESTS = 10 ** 9
+
+    await api_server.app.router.startup()
+    transport = httpx.ASGITransport(app=api_server.app, client=("10.0.0.1", 1234))
+    results = {}
+    created = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench/api", timeout=30) as client:
+            await seed(client, args.containers)
+
+            async def captcha(i):
+                return "POST", "/captcha/request", {}
+
+            async def create(i):
+                return "POST", "/containers", {"json": {"captcha_token": await mint_captcha()}, "headers": API_KEY_HEADER}
+
+            async def listing(i):
+                return "GET", "/containers", {"params": {"limit": args.page_size}}
+
+            etag = None
+
+            async def listing_cached(i):
+                return "GET", "/containers", {"params": {"limit": args.page_size}, "headers": {"If-None-Match": etag}}
+
+            async def rate_limit(i):
+                return "GET", "/rate-limit", {}
+
+            async def delete(i):
+                return "DELETE", f"/containers/{created[i]}", {
+                    "json": {"captcha_token": await mint_captcha()}, "headers": API_KEY_HEADER
+                }
+
+            for name in args.scenarios:
+                if name == "captcha":
+                    results[name] = await run(client, args.requests, args.concurrency, captcha)
+                elif name == "create":
+                    before = set(await api_server.r.zrange(api_server.index.INDEX_KEY, 0, -1))
+                    results[name] = await run(client, args.requests, args.concurrency, create)
+                    created = [c for c in await api_server.r.zrange(api_server.index.INDEX_KEY, 0, -1) if c not in before]
+                elif name == "list":
+                    results[name] = await run(client, args.requests, args.concurrency, listing)
+                elif name == "list_cached":
+                    etag = (await client.get("/containers", params={"limit": args.page_size})).headers.get("etag")
+                    results[name] = await run(client, args.requests, args.concurrency, listing_cached)
+                elif name == "rate_limit":
+                    results[name] = await run(client, args.requests, args.concurrency, rate_limit)
+                elif name == "rejected":
+                    api_server.RATE_LIMIT_REQUESTS = 0
+                    try:
+                        results[name] = await run(client, args.requests, args.concurrency, listing)
+                    finally:
+                        api_server.RATE_LIMIT_REQUESTS = 10 ** 9
+                elif name == "delete":
+                    if not created:
+                        created = await seed(client, args.requests)
+                    results[name] = await run(client, len(created), args.concurrency, delete)
+    finally:
+        await api_server.app.router.shutdown()
+
+    return {
+        "config": {
+            "redis": "fakeredis" if args.redis_url == "fake" else args.redis_url,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "containers": args.containers,
+            "page_size": args.page_size,
+            "python": platform.python_version(),
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API load test")
+    parser.add_argument("--redis-url", default=os.getenv("BENCH_REDIS_URL", "fake"),
+                        help="redis:// URL of a scratch database, or 'fake' for in-process fakeredis")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--containers", type=int, default=100, help="containers seeded before listing")
+    parser.add_argument("--page-size", type=int, default=api_server.LIST_DEFAULT_LIMIT, help="GET /containers limit")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated subset, run in this order")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # The API logs with print(); keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(bench(args))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Stand-in Kubernetes API server for benchmarks.
+
+Implements just enough of the core/v1 pods API for the worker to run
+against it without a cluster: create, list (with label selectors), read,
+metadata patch (honouring a resourceVersion precondition), delete, delete
+collection (by label selector) and watch, plus a namespace list for the health check. Pods move
+through Pending -> scheduled -> Running/Ready on a timer and disappear a
+configurable time after deletion, so the pod tracker sees realistic watch
+events.
+
+Every non-watch request can be slowed down or failed on purpose:
+
+    --latency-ms / --jitter-ms  added to each response
+    --error-rate                fraction answered 500
+    --throttle-rate             fraction answered 429 with Retry-After
+    --conflict-rate             fraction of creates answered 409 *after*
+                                creating the pod (a create that timed out
+                                but went through)
+
+Run standalone and point a kubeconfig at it:
+
+    python benchmarks/fake_k8s.py --port 8001 --kubeconfig /tmp/fake-kubeconfig
+    KUBECONFIG=/tmp/fake-kubeconfig python main.py
+
+Only plain HTTP, no auth, one resource type; it is a load generator, not an
+emulator.
+"""
+import re
+import json
+import time
+import heapq
+import uuid
+import random
+import argparse
+import threading
+from copy import deepcopy
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+EVENT_LOG_SIZE = 50000  # watch history kept; older resourceVersions get 410 Gone
+
+POD_PATH = re.compile(r"^/api/v1/namespaces/([^/]+)/pods(?:/([^/]+))?$")
+
+
+def now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def status_body(code, reason, message):
+    return {"kind": "Status", "apiVersion": "v1", "metadata": {}, "status": "Failure",
+            "message": message, "reason": reason, "code": code}
+
+
+SELECTOR_TERM = re.compile(r"\s*(!?)([\w./-]+)\s*(?:in\s*\(([^)]*)\)|==?\s*([^,\s]*))?\s*(?:,|$)")
+
+
+def parse_selector(selector):
+    """
+    'a=b,c in (d,e),!f' -> {'a': {'b'}, 'c': {'d', 'e'}, 'f': {None}};
+    equality, set-based 'in' and '!key' (label absent) only
+    """
+    labels = {}
+    for absent, key, values, value in SELECTOR_TERM.findall(selector or ""):
+        if absent:
+            labels[key] = {None}
+        else:
+            labels[key] = {v.strip() for v in values.split(",")} if values else {value}
+    return labels
+
+
+def matches(pod, namespace, selector):
+    if pod["metadata"]["namespace"] != namespace:
+        return False
+    labels = pod["metadata"].get("labels") or {}
+    return all(labels.get(k) in values for k, values in selector.items())
+
+
+class FakeCluster:
+    """Pod store with a resourceVersion-ordered event log for watches"""
+
+    def __init__(self, start_delay=0.5, delete_delay=0.2):
+        self.start_delay = start_delay
+        self.delete_delay = delete_delay
+        self.cond = threading.Condition()
+        self.pods = {}  # (namespace, name) -> pod
+        self.events = []  # (resourceVersion, type, pod snapshot)
+        self.resource_version = 0
+        self.stats = {}  # "verb resource" / injected outcome -> count
+        self._timers = []  # heap of (due, seq, action, key)
+        self._seq = 0
+        threading.Thread(target=self._run_timers, name="fake-k8s-timers", daemon=True).start()
+
+    def count(self, name):
+        with self.cond:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    # Event log (call with self.cond held)
+    def _record(self, event_type, pod):
+        self.resource_version += 1
+        pod["metadata"]["resourceVersion"] = str(self.resource_version)
+        self.events.append((self.resource_version, event_type, deepcopy(pod)))
+        if len(self.events) > EVENT_LOG_SIZE:
+            del self.events[:len(self.events) - EVENT_LOG_SIZE]
+        self.cond.notify_all()
+
+    def _schedule(self, delay, action, key):
+        self._seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._seq, action, key))
+        self.cond.notify_all()
+
+    def _run_timers(self):
+        with self.cond:
+            while True:
+                if not self._timers:
+                    self.cond.wait()
+                    continue
+                due = self._timers[0][0] - time.monotonic()
+                if due > 0:
+                    self.cond.wait(due)
+                    continue
+                _, _, action, key = heapq.heappop(self._timers)
+                pod = self.pods.get(key)
+                if pod is None:
+                    continue
+                if action == "schedule" and not pod["metadata"].get("deletionTimestamp"):
+                    pod["spec"]["nodeName"] = "fake-node"
+                    pod["status"]["conditions"] = [{"type": "PodScheduled", "status": "True"}]
+                    self._record("MODIFIED", pod)
+                elif action == "ready" and not pod["metadata"].get("deletionTimestamp"):
+                    pod["status"]["phase"] = "Running"
+                    pod["status"]["podIP"] = "10.42.0.%d" % random.randint(2, 254)
+                    pod["status"]["conditions"] = [
+                        {"type": "PodScheduled", "status": "True"},
+                        {"type": "Ready", "status": "True"},
+                    ]
+                    self._record("MODIFIED", pod)
+                elif action == "remove":
+                    del self.pods[key]
+                    self._record("DELETED", pod)
+
+    # Pods
+    def create(self, namespace, body):
+        meta = body.setdefault("metadata", {})
+        name = meta.get("name")
+        with self.cond:
+            if (namespace, name) in self.pods:
+                return None
+            meta.update({
+                "namespace": namespace,
+                "uid": str(uuid.uuid4()),
+                "creationTimestamp": now_iso(),
+            })
+            body.setdefault("spec", {}).setdefault("containers", [])
+            body["status"] = {"phase": "Pending"}
+            self.pods[(namespace, name)] = body
+            self._record("ADDED", body)
+            self._schedule(self.start_delay / 2, "schedule", (namespace, name))
+            self._schedule(self.start_delay, "ready", (namespace, name))
+            return deepcopy(body)
+
+    def get(self, namespace, name):
+        with self.cond:
+            pod = self.pods.get((namespace, name))
+            return deepcopy(pod) if pod else None
+
+    def list(self, namespace, selector):
+        with self.cond:
+            items = [deepcopy(p) for p in self.pods.values() if matches(p, namespace, selector)]
+            return items, str(self.resource_version)
+
+    def patch(self, namespace, name, body):
+        """
+        Merge metadata labels/annotations (None removes a key). Returns the
+        pod, None if it doesn't exist or False if the patch carries a stale
+        metadata.resourceVersion.
+        """
+        meta = body.get("metadata") or {}
+        with self.cond:
+            pod = self.pods.get((namespace, name))
+            if pod is None:
+                return None
+            expected = meta.get("resourceVersion")
+            if expected and expected != pod["metadata"]["resourceVersion"]:
+                return False
+            for field in ("labels", "annotations"):
+                if field in meta:
+                    current = pod["metadata"].get(field) or {}
+                    for key, value in (meta[field] or {}).items():
+                        if value is None:
+                            current.pop(key, None)
+                        else:
+                            current[key] = value
+                    pod["metadata"][field] = current
+            self._record("MODIFIED", pod)
+            return deepcopy(pod)
+
+    def delete(self, namespace, name):
+        with self.cond:
+            pod = self.pods.get((namespace, name))
+            if pod is None:
+                return None
+            if not pod["metadata"].get("deletionTimestamp"):
+                pod["metadata"]["deletionTimestamp"] = now_iso()
+                self._record("MODIFIED", pod)
+                self._schedule(self.delete_delay, "remove", (namespace, name))
+            return deepcopy(pod)
+
+    def delete_collection(self, namespace, selector):
+        with self.cond:
+            names = [name for (ns, name), pod in self.pods.items() if matches(pod, namespace, selector)]
+        return [pod for pod in (self.delete(namespace, name) for name in names) if pod is not None]
+
+    def watch(self, namespace, selector, resource_version, timeout):
+        """Yield (type, pod) after resource_version until timeout; raises LookupError if too old"""
+        deadline = time.monotonic() + timeout
+        initial = []
+        with self.cond:
+            if not resource_version:
+                # No version: current state first, like the real API server
+                initial = [deepcopy(p) for p in self.pods.values() if matches(p, namespace, selector)]
+                last = self.resource_version
+            else:
+                last = int(resource_version)
+                if self.events and last < self.events[0][0] - 1:
+                    raise LookupError(resource_version)
+        for pod in initial:
+            yield "ADDED", pod
+        while True:
+            with self.cond:
+                # resourceVersions in the log are contiguous, so slice instead of scanning
+                first = self.events[0][0] if self.events else last + 1
+                pending = self.events[max(0, last + 1 - first):]
+                if not pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self.cond.wait(min(remaining, 1))
+                    continue
+            for rv, event_type, pod in pending:
+                last = rv
+                if matches(pod, namespace, selector):
+                    yield event_type, pod
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling is exercised
+    cluster: FakeCluster = None
+    options = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, code, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def inject(self, verb):
+        """Apply configured latency and failures; True if a response was already sent"""
+        opts = self.options
+        delay = opts.latency_ms + random.uniform(0, opts.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < opts.error_rate:
+            self.cluster.count("injected 500")
+            self.send_json(500, status_body(500, "InternalError", "injected failure"))
+            return True
+        if roll < opts.error_rate + opts.throttle_rate:
+            self.cluster.count("injected 429")
+            self.send_json(429, status_body(429, "TooManyRequests", "injected throttle"),
+                           {"Retry-After": "1"})
+            return True
+        return False
+
+    def route(self, method):
+        # Always consume the body: anything left unread would be parsed as
+        # the next request on this keep-alive connection
+        body = self.read_body() if method in ("POST", "PATCH", "DELETE") else None
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/api/v1/namespaces" and method == "GET":
+            self.cluster.count("list namespaces")
+            if not self.inject("list"):
+                self.send_json(200, {"kind": "NamespaceList", "apiVersion": "v1", "metadata": {},
+                                     "items": [{"metadata": {"name": self.options.namespace}}]})
+            return
+        match = POD_PATH.match(url.path)
+        if not match:
+            self.send_json(404, status_body(404, "NotFound", f"{method} {url.path} is not implemented"))
+            return
+        namespace, name = match.groups()
+        verb = {"GET": "read" if name else "list", "POST": "create", "PATCH": "patch",
+                "DELETE": "delete" if name else "deletecollection"}.get(method)
+        if verb == "list" and (query.get("watch") or "").lower() in ("true", "1"):
+            self.cluster.count("watch pods")
+            return self.watch(namespace, query)
+        self.cluster.count(f"{verb} pods")
+        if verb is None:
+            self.send_json(405, status_body(405, "MethodNotAllowed", method))
+            return
+        if self.inject(verb):
+            return
+        if verb == "create":
+            pod = self.cluster.create(namespace, body)
+            if pod is None:
+                self.send_json(409, status_body(409, "AlreadyExists", f'pods "{body["metadata"]["name"]}" already exists'))
+            elif random.random() < self.options.conflict_rate:
+                self.cluster.count("injected 409")
+                self.send_json(409, status_body(409, "AlreadyExists", f'pods "{body["metadata"]["name"]}" already exists'))
+            else:
+                self.send_json(201, pod)
+        elif verb == "list":
+            items, rv = self.cluster.list(namespace, parse_selector(query.get("labelSelector")))
+            self.send_json(200, {"kind": "PodList", "apiVersion": "v1",
+                                 "metadata": {"resourceVersion": rv}, "items": items})
+        elif verb == "read":
+            pod = self.cluster.get(namespace, name)
+            if pod is None:
+                self.send_json(404, status_body(404, "NotFound", f'pods "{name}" not found'))
+            else:
+                self.send_json(200, pod)
+        elif verb == "patch":
+            pod = self.cluster.patch(namespace, name, body)
+            if pod is None:
+                self.send_json(404, status_body(404, "NotFound", f'pods "{name}" not found'))
+            elif pod is False:
+                self.send_json(409, status_body(409, "Conflict", f'Operation cannot be fulfilled on pods "{name}": '
+                                                                 "the object has been modified"))
+            else:
+                self.send_json(200, pod)
+        elif verb == "deletecollection":
+            items = self.cluster.delete_collection(namespace, parse_selector(query.get("labelSelector")))
+            self.send_json(200, {"kind": "PodList", "apiVersion": "v1", "metadata": {}, "items": items})
+        elif verb == "delete":
+            pod = self.cluster.delete(namespace, name)
+            if pod is None:
+                self.send_json(404, status_body(404, "NotFound", f'pods "{name}" not found'))
+            else:
+                self.send_json(200, pod)
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def watch(self, namespace, query):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        selector = parse_selector(query.get("labelSelector"))
+        timeout = float(query.get("timeoutSeconds") or 300)
+        try:
+            for event_type, pod in self.cluster.watch(namespace, selector, query.get("resourceVersion"), timeout):
+                self.write_chunk(json.dumps({"type": event_type, "object": pod}).encode() + b"\n")
+        except LookupError as e:
+            gone = status_body(410, "Expired", f"too old resource version: {e}")
+            self.write_chunk(json.dumps({"type": "ERROR", "object": gone}).encode() + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def do_PATCH(self):
+        self.route("PATCH")
+
+    def do_DELETE(self):
+        self.route("DELETE")
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra latency, 0..jitter")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered 500")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered 429")
+    parser.add_argument("--conflict-rate", type=float, default=0, help="fraction of creates answered 409")
+    parser.add_argument("--start-delay", type=float, default=0.5, help="seconds from create to Ready")
+    parser.add_argument("--delete-delay", type=float, default=0.2, help="seconds from delete to gone")
+    parser.add_argument("--namespace", default="sprout")
+
+
+def serve(options, port=0):
+    """Start the server on a background thread; returns (server, cluster)"""
+    cluster = FakeCluster(options.start_delay, options.delete_delay)
+    handler = type("BoundHandler", (Handler,), {"cluster": cluster, "options": options})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-k8s", daemon=True).start()
+    return server, cluster
+
+
+def write_kubeconfig(path, server_url, namespace="sprout"):
+    """Minimal kubeconfig pointing at server_url (JSON is valid YAML)"""
+    config = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": "fake", "cluster": {"server": server_url}}],
+        "users": [{"name": "fake", "user": {"token": "fake"}}],
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake", "namespace": namespace}}],
+        "current-context": "fake",
+    }
+    with open(path, "w") as f:
+        json.dump(config, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Kubernetes pods API")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--kubeconfig", help="write a kubeconfig for this server here")
+    add_arguments(parser)
+    options = parser.parse_args()
+    server, cluster = serve(options, options.port)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    if options.kubeconfig:
+        write_kubeconfig(options.kubeconfig, url, options.namespace)
+    print(f"Fake Kubernetes API listening on {url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps({"pods": len(cluster.pods), "requests": cluster.stats}))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Worker drain benchmark, no cluster required.
+
+Starts the fake Kubernetes API server (fake_k8s.py) and points a temporary
+kubeconfig at it, runs the worker's ``process_stream()`` in-process (and
+waits for the warm pool to fill when ``--warm-pool`` is set), then writes a
+burst of commands into the command stream(s) exactly as the API does and
+measures (with ``--backlog`` the burst is written first and the worker
+started after it, the way KEDA scales up from zero):
+
+- drain: time from the first enqueued command until every command is
+  handled and nothing is pending, lagging or waiting for a retry;
+- settle: time until every container reached its final state (running
+  for ``--mix create``, gone for ``--mix create-delete``), which includes
+  the pod tracker's watch;
+- with ``--mix create-heavy``, ``--deletes`` containers are created and
+  running before the clock starts, then the burst of creates is queued
+  followed by deletes of those containers: the container_deleted latency
+  is how long freeing a slot takes behind a create backlog (compare
+  ``--priority-lanes``);
+- per-event latency (enqueued -> handled) and service time by event type;
+  events the worker coalesced away are counted but never handled.
+
+    python benchmarks/worker_bench.py --events 500 --concurrency 8
+    python benchmarks/worker_bench.py --events 200 --mix create-delete --latency-ms 20 --throttle-rate 0.05
+    python benchmarks/worker_bench.py --events 4 --warm-pool 4 --start-delay 3
+    python benchmarks/worker_bench.py --events 200 --mix create-delete --backlog
+    python benchmarks/worker_bench.py --events 500 --partitions 4 --workers 2
+    python benchmarks/worker_bench.py --events 300 --mix create-heavy --deletes 20 --latency-ms 20 --priority-lanes
+
+Redis is an in-process fakeredis by default; ``--redis-url`` runs against a
+real server instead (database 0, so use a scratch instance). Fake Kubernetes
+options (latency, errors, 409/429) are the same as fake_k8s.py's.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import platform
+import threading
+from urllib.parse import urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, BENCH_DIR)
+
+import redis
+import fake_k8s
+
+
+def latency_summary(values):
+    from api_bench import percentile  # imports the API, so only after configure_environment
+    ordered = sorted(values)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "count": len(ordered),
+        "p50": ms(percentile(ordered, 50)),
+        "p95": ms(percentile(ordered, 95)),
+        "p99": ms(percentile(ordered, 99)),
+        "max": ms(ordered[-1]) if ordered else None,
+    }
+
+
+def configure_environment(args, kubeconfig):
+    """Everything main.py reads at import time"""
+    os.environ.pop("KUBERNETES_SERVICE_HOST", None)  # never pick up in-cluster config
+    os.environ["KUBECONFIG"] = kubeconfig
+    os.environ["NAMESPACE"] = args.namespace
+    os.environ["WORKER_BATCH_SIZE"] = str(args.batch_size)
+    os.environ["WORKER_CONCURRENCY"] = str(args.concurrency)
+    os.environ.setdefault("THROUGHPUT_LOG_INTERVAL", "5")
+    # Leave room for the whole burst plus the pool
+    os.environ["MAX_CONTAINERS"] = str(args.events + args.deletes + args.warm_pool)
+    os.environ["WARM_POOL_SIZE"] = str(args.warm_pool)
+    os.environ["WARM_POOL_IMAGES"] = "nginx:latest"
+    os.environ["EVENT_PARTITIONS"] = str(args.partitions)
+    os.environ["PRIORITY_LANES"] = str(args.priority_lanes).lower()
+    os.environ["K8S_QPS"] = str(args.k8s_qps)
+    os.environ["K8S_BURST"] = str(args.k8s_burst)
+    if args.redis_url == "fake":
+        import fakeredis  # only needed for the in-process stand-in
+        server = fakeredis.FakeServer()
+        redis.Redis = lambda *a, **kw: fakeredis.FakeRedis(server=server)
+    else:
+        url = urlparse(args.redis_url)
+        os.environ["REDIS_HOST"] = url.hostname or "localhost"
+        os.environ["REDIS_PORT"] = str(url.port or 6379)
+        if url.password:
+            os.environ["REDIS_PASSWORD"] = url.password
+
+
+def enqueue_creates(main, api_server, count):
+    """Write creates the way the API does; returns the container ids"""
+    import container_index as index
+    import streams
+    create = main.r.register_script(api_server.CREATE_CONTAINER_LUA)
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    for container_id in ids:
+        captcha = f"captcha:{uuid.uuid4()}"
+        main.r.setex(captcha, 300, "valid")
+        create(
+            keys=[captcha, index.container_key(container_id), streams.events_stream(container_id), streams.STATUS_STREAM,
+                  index.VERSION_KEY, index.INDEX_KEY, *index.ACTIVE_STATUS_KEYS, *index.STATUS_KEYS],
+            args=[container_id, f"bench-{container_id[:8]}", "nginx:latest", time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                  time.time(), index.CONTAINER_TTL, 10 ** 9, len(index.ACTIVE_STATUS_KEYS),
+                  streams.STATUS_STREAM_MAXLEN]
+        )
+    return ids
+
+
+def enqueue_deletes(main, api_server, ids):
+    """Write deletes the way the API does (priority lane included)"""
+    import container_index as index
+    import streams
+    delete = main.r.register_script(api_server.DELETE_CONTAINER_LUA)
+    for container_id in ids:
+        captcha = f"captcha:{uuid.uuid4()}"
+        main.r.setex(captcha, 300, "valid")
+        delete(keys=[captcha, index.container_key(container_id), streams.events_stream(container_id, priority=True)],
+               args=[container_id, time.strftime("%Y-%m-%dT%H:%M:%S")])
+
+
+def enqueue(main, api_server, args, seeded=()):
+    """Write the burst: creates, then deletes of them (create-delete) or of ``seeded`` (create-heavy)"""
+    ids = enqueue_creates(main, api_server, args.events)
+    if args.mix == "create-delete":
+        enqueue_deletes(main, api_server, ids)
+    elif args.mix == "create-heavy":
+        enqueue_deletes(main, api_server, seeded)
+    return ids
+
+
+def backlog(main):
+    """(lag, pending, waiting retries) for the worker's consumer group, summed over partitions"""
+    import streams
+    total_lag = total_pending = retries = 0
+    for stream in streams.COMMAND_STREAMS:
+        lag, pending = None, 0
+        for group in main.r.xinfo_groups(stream):
+            name = group["name"].decode() if isinstance(group["name"], bytes) else group["name"]
+            if name == streams.CONSUMER_GROUP:
+                pending = group["pending"]
+                lag = group.get("lag")
+                if lag is None:  # Redis < 7
+                    last = main.r.xinfo_stream(stream)["last-generated-id"]
+                    lag = 0 if group["last-delivered-id"] == last else 1
+        total_lag += 1 if lag is None else lag
+        total_pending += pending
+        retries += main.r.zcard(streams.retry_key(stream))
+    return total_lag, total_pending, retries
+
+
+def coalesced(main):
+    """Events the worker ACKed without handling them (see main.coalesce)"""
+    return int(sum(
+        sample.value for metric in main.metrics.EVENTS_COALESCED.collect()
+        for sample in metric.samples if sample.name.endswith("_total")
+    ))
+
+
+def throttled(main):
+    """Calls held back by the shared rate limit and pauses started, by reason"""
+    return {
+        sample.labels["reason"]: int(sample.value)
+        for metric in main.metrics.K8S_THROTTLED.collect()
+        for sample in metric.samples if sample.name.endswith("_total")
+    }
+
+
+def settled(main, ids, mix):
+    import container_index as index
+    if mix == "create":
+        return main.r.zcard(index.status_key("running")) >= len(ids)
+    if mix == "create-heavy":
+        # The seeded containers are gone and the burst is running
+        return main.r.zcard(index.INDEX_KEY) == len(ids) and main.r.zcard(index.status_key("running")) >= len(ids)
+    return main.r.zcard(index.INDEX_KEY) == 0
+
+
+def start_workers(main, count):
+    """
+    Run ``count`` process_stream loops in this process. Each gets its own
+    WORKER_ID, so they split the partitions between them like replicas do.
+    """
+    for n in range(count):
+        if count > 1:
+            main.WORKER_ID = f"bench-worker-{n}"
+        threading.Thread(target=main.process_stream, name=f"worker-{n}", daemon=True).start()
+        time.sleep(0.05)  # process_stream reads WORKER_ID on entry
+
+
+def bench(args):
+    server, cluster = fake_k8s.serve(args)
+    kubeconfig = os.path.join(tempfile.mkdtemp(prefix="sprout-bench-"), "kubeconfig")
+    fake_k8s.write_kubeconfig(kubeconfig, f"http://127.0.0.1:{server.server_address[1]}", args.namespace)
+    configure_environment(args, kubeconfig)
+
+    import main  # connects to Redis on import
+    import api_server
+    import streams
+    logging.getLogger().setLevel(args.log_level)
+
+    records = []  # (event type, success, enqueued -> handled, service time)
+    lock = threading.Lock()
+    handle_event = main.handle_event
+
+    def timed_handle_event(message_id, event, *args):
+        start = time.time()
+        success = handle_event(message_id, event, *args)
+        done = time.time()
+        entry_id = message_id.decode() if isinstance(message_id, bytes) else message_id
+        enqueued = int(entry_id.split("-")[0]) / 1000
+        with lock:
+            records.append((event.get("event_type"), success, done - enqueued, done - start))
+        return success
+
+    main.handle_event = timed_handle_event
+
+    deadline = time.time() + args.timeout
+    if args.backlog:
+        # Scale from zero: the whole burst is waiting before the worker starts
+        for stream in streams.COMMAND_STREAMS:
+            main.r.xgroup_create(stream, streams.CONSUMER_GROUP, id="0", mkstream=True)
+        ids = enqueue(main, api_server, args)
+        started = time.time()
+        start_workers(main, args.workers)
+    else:
+        start_workers(main, args.workers)
+        if args.warm_pool:
+            while time.time() < deadline:
+                pool = main.warm_pool
+                if pool and sum(len(ready) for ready in pool.ready.values()) >= args.warm_pool:
+                    break
+                time.sleep(0.05)
+        else:
+            time.sleep(0.5)  # consumer group and pod watch
+        seeded = []
+        if args.mix == "create-heavy":
+            import container_index as index
+            seeded = enqueue_creates(main, api_server, args.deletes)
+            while time.time() < deadline and main.r.zcard(index.status_key("running")) < len(seeded):
+                time.sleep(0.05)
+            with lock:
+                records.clear()
+        started = time.time()
+        ids = enqueue(main, api_server, args, seeded)
+    total = len(ids) * (2 if args.mix == "create-delete" else 1) + (args.deletes if args.mix == "create-heavy" else 0)
+    drain_s = settle_s = None
+    while time.time() < deadline:
+        if drain_s is None:
+            with lock:
+                handled = sum(1 for r in records if r[1])
+            dead = main.r.xlen(streams.DEAD_LETTER_STREAM) if main.r.exists(streams.DEAD_LETTER_STREAM) else 0
+            if handled + dead + coalesced(main) >= total and backlog(main) == (0, 0, 0):
+                drain_s = time.time() - started
+        if settle_s is None and settled(main, ids, args.mix):
+            settle_s = time.time() - started
+        if drain_s is not None and settle_s is not None:
+            break
+        time.sleep(0.02)
+
+    with lock:
+        done = list(records)
+    by_type = {}
+    for event_type, success, latency, service in done:
+        entry = by_type.setdefault(event_type, {"ok": 0, "failed": 0, "latency": [], "service": []})
+        entry["ok" if success else "failed"] += 1
+        entry["latency"].append(latency)
+        entry["service"].append(service)
+    server.shutdown()
+    return {
+        "config": {
+            "redis": "fakeredis" if args.redis_url == "fake" else args.redis_url,
+            "events": total,
+            "containers": len(ids),
+            "mix": args.mix,
+            "batch_size": args.batch_size,
+            "concurrency": args.concurrency,
+            "warm_pool": args.warm_pool,
+            "backlog": args.backlog,
+            "deletes": args.deletes if args.mix == "create-heavy" else None,
+            "priority_lanes": args.priority_lanes,
+            "partitions": args.partitions,
+            "workers": args.workers,
+            "k8s_latency_ms": args.latency_ms,
+            "k8s_jitter_ms": args.jitter_ms,
+            "k8s_error_rate": args.error_rate,
+            "k8s_throttle_rate": args.throttle_rate,
+            "k8s_conflict_rate": args.conflict_rate,
+            "k8s_qps": args.k8s_qps,
+            "pod_start_delay_s": args.start_delay,
+            "python": platform.python_version(),
+            "timestamp": started,
+        },
+        "results": {
+            "timed_out": drain_s is None or settle_s is None,
+            "drain_s": round(drain_s, 3) if drain_s is not None else None,
+            "events_per_sec": round(total / drain_s, 1) if drain_s else None,
+            "settle_s": round(settle_s, 3) if settle_s is not None else None,
+            "attempts": len(done),
+            "coalesced": coalesced(main),
+            "dead_lettered": main.r.xlen(streams.DEAD_LETTER_STREAM) if main.r.exists(streams.DEAD_LETTER_STREAM) else 0,
+            "by_event_type": {
+                event_type: {
+                    "ok": entry["ok"],
+                    "failed_attempts": entry["failed"],
+                    "latency_ms": latency_summary(entry["latency"]),
+                    "service_ms": latency_summary(entry["service"]),
+                }
+                for event_type, entry in by_type.items()
+            },
+            "k8s_requests": dict(sorted(cluster.stats.items())),
+            "k8s_throttled": throttled(main),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker drain benchmark against a fake Kubernetes API")
+    parser.add_argument("--events", type=int, default=200, help="containers to create")
+    parser.add_argument("--mix", choices=("create", "create-delete", "create-heavy"), default="create",
+                        help="create only, create then delete every container, or creates then deletes of "
+                             "--deletes containers started beforehand")
+    parser.add_argument("--deletes", type=int, default=20, help="containers deleted behind the burst (create-heavy)")
+    parser.add_argument("--priority-lanes", action="store_true", help="PRIORITY_LANES: deletes skip ahead of creates")
+    parser.add_argument("--redis-url", default=os.getenv("BENCH_REDIS_URL", "fake"),
+                        help="redis:// URL of a scratch server, or 'fake' for in-process fakeredis")
+    parser.add_argument("--batch-size", type=int, default=16, help="WORKER_BATCH_SIZE")
+    parser.add_argument("--concurrency", type=int, default=8, help="WORKER_CONCURRENCY")
+    parser.add_argument("--warm-pool", type=int, default=0, help="WARM_POOL_SIZE for nginx:latest")
+    parser.add_argument("--backlog", action="store_true",
+                        help="enqueue everything before the worker starts (scale from zero); timing starts with the worker")
+    parser.add_argument("--partitions", type=int, default=1, help="EVENT_PARTITIONS")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker loops sharing the partitions (in one process, sharing one Kubernetes client)")
+    parser.add_argument("--k8s-qps", type=float, default=0, help="K8S_QPS (0: no rate limit, 429 pauses only)")
+    parser.add_argument("--k8s-burst", type=int, default=100, help="K8S_BURST")
+    parser.add_argument("--timeout", type=float, default=300, help="give up after this many seconds")
+    parser.add_argument("--log-level", default="WARNING", help="worker log level during the run")
+    parser.add_argument("--output", help="also write the JSON report here")
+    fake_k8s.add_arguments(parser)
+    args = parser.parse_args()
+    if args.backlog and args.mix == "create-heavy":
+        parser.error("--mix create-heavy needs a running worker to start the containers it deletes; drop --backlog")
+
+    report = bench(args)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Container index shared by the API and the worker.
+
+Every container lives in a hash ``container:{id}`` that expires 24h after
+creation. Next to it we keep sorted sets scored by that expiry timestamp:
+
+- ``containers:index``           every live container id
+- ``containers:status:{status}`` the ids currently in ``status``
+
+Quota checks become a couple of ZCARDs and listings only touch container
+keys instead of running KEYS over the whole keyspace. Entries whose score is
+in the past belong to hashes Redis has already expired; PRUNE_EXPIRED_LUA
+drops them lazily so the index follows the hash TTLs without keyspace
+notifications.
+
+``containers:version`` is a counter bumped by every script that changes what
+a listing would return (create, status or field changes, removal, pruning).
+The API caches listings per version and hands it out as the ETag.
+
+The scripts are plain Lua sources so both the asyncio client in
+``api_server.py`` and the blocking client in ``main.py`` can register them.
+"""
+
+CONTAINER_TTL = 24 * 60 * 60  # seconds, matches the container hash TTL
+
+INDEX_KEY = "containers:index"
+VERSION_KEY = "containers:version"
+STATUS_KEY_PREFIX = "containers:status:"
+
+# Every status the worker or API can write. Pruning walks these sets.
+# pending -> starting (pod scheduled, not ready) -> running (ready)
+# -> terminating (deletion requested) -> gone
+STATUSES = ("pending", "starting", "running", "terminating", "failed", "deletion_failed")
+# Statuses that count against MAX_CONTAINERS. "pending" must come first:
+# the API's create script adds new containers to ACTIVE_STATUS_KEYS[0].
+ACTIVE_STATUSES = ("pending", "starting", "running")
+
+
+def container_key(container_id):
+    return f"container:{container_id}"
+
+
+def status_key(status):
+    return f"{STATUS_KEY_PREFIX}{status}"
+
+
+STATUS_KEYS = [status_key(s) for s in STATUSES]
+ACTIVE_STATUS_KEYS = [status_key(s) for s in ACTIVE_STATUSES]
+
+
+# KEYS: version, index, status sets... ARGV: now
+# Returns the ids that expired since the last prune.
+PRUNE_EXPIRED_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if #expired > 0 then
+    for i = 2, #KEYS do
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', ARGV[1])
+    end
+    redis.call('INCR', KEYS[1])
+end
+return expired
+"""
+
+# KEYS: container hash, index, version
+# ARGV: id, status, now, ttl, only if indexed (0/1), [field, value]...
+# Moves the id between status sets and writes the hash in one step. The
+# hash keeps the expiry recorded in the index so status updates never
+# extend (or drop) the 24h TTL. With "only if indexed" set, containers that
+# were already deleted or expired are left alone instead of resurrected.
+# Returns {applied, previous status}.
+SET_STATUS_LUA = """
+local old = redis.call('HGET', KEYS[1], 'status')
+local expires = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not expires then
+    if ARGV[5] == '1' then
+        return {0, old}
+    end
+    expires = tonumber(ARGV[3]) + tonumber(ARGV[4])
+    redis.call('ZADD', KEYS[2], expires, ARGV[1])
+end
+if old and old ~= ARGV[2] then
+    redis.call('ZREM', '""" + STATUS_KEY_PREFIX + """' .. old, ARGV[1])
+end
+redis.call('ZADD', '""" + STATUS_KEY_PREFIX + """' .. ARGV[2], expires, ARGV[1])
+redis.call('HSET', KEYS[1], 'status', ARGV[2], unpack(ARGV, 6))
+redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(expires)))
+redis.call('INCR', KEYS[3])
+return {1, old}
+"""
+
+# KEYS: container hash, version
+# ARGV: [field, value]...
+# Adds details to a container without touching its status, and only if it
+# still exists. Returns 1 if the hash was updated.
+UPDATE_FIELDS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+redis.call('INCR', KEYS[2])
+return 1
+"""
+
+# KEYS: container hash, index, version
+# ARGV: id
+# Drops the hash and every index entry. Returns 1 if the hash existed.
+REMOVE_LUA = """
+local old = redis.call('HGET', KEYS[1], 'status')
+if old then
+    redis.call('ZREM', '""" + STATUS_KEY_PREFIX + """' .. old, ARGV[1])
+end
+local indexed = redis.call('ZREM', KEYS[2], ARGV[1])
+local existed = redis.call('DEL', KEYS[1])
+if existed + indexed > 0 then
+    redis.call('INCR', KEYS[3])
+end
+return existed
+"""
+
+# KEYS: container hash, index, version
+# ARGV: id, now, ttl
+# Indexes a container hash written before the index existed. The score is
+# the hash's own expiry (its remaining TTL, or a fresh ``ttl`` if it has
+# none) and the id joins the set of the status the hash records. Ids that
+# are already indexed, or whose hash is gone, are left alone. Returns 1 if
+# the container was added.
+BACKFILL_LUA = """
+if redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    return 0
+end
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return 0
+end
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < 0 then
+    ttl = tonumber(ARGV[3])
+end
+local expires = tonumber(ARGV[2]) + ttl
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status then
+    status = 'pending'
+    redis.call('HSET', KEYS[1], 'status', status)
+end
+redis.call('ZADD', KEYS[2], expires, ARGV[1])
+redis.call('ZADD', '""" + STATUS_KEY_PREFIX + """' .. status, expires, ARGV[1])
+redis.call('EXPIREAT', KEYS[1], math.ceil(expires))
+redis.call('INCR', KEYS[3])
+return 1
+"""
+# Set once every pre-index container hash has been backfilled
+BACKFILLED_KEY = "containers:backfilled"
+
+
+def field_args(fields):
+    """Flatten a mapping into HSET style field/value arguments"""
+    args = []
+    for field, value in (fields or {}).items():
+        if field == "status":
+            continue
+        args.extend([field, value])
+    return args
+
+
+def status_args(container_id, status, now, fields=None, only_if_indexed=False):
+    """Flatten SET_STATUS_LUA arguments"""
+    return [container_id, status, now, CONTAINER_TTL, int(only_if_indexed)] + field_args(fields)
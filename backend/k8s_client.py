@@ -0,0 +1,167 @@
+"""Process-wide Kubernetes client for the worker.
+
+``client.CoreV1Api()`` without arguments builds a fresh ApiClient, and with
+it a fresh urllib3 pool, so every call paid for a new TCP + TLS handshake
+with the API server. Here one ApiClient is shared by every thread: its pool
+is sized for the worker's concurrency, idle connections are kept alive with
+TCP keepalive, and every call gets a connect/read timeout.
+
+All API calls go through ``request()`` so cross-cutting behaviour has a
+single place to live. When ``throttle`` is set (a k8s_throttle.KubeThrottle)
+every call first waits for its rate limit, and 429s are retried after their
+Retry-After up to K8S_THROTTLE_RETRIES times.
+
+Importing the ``kubernetes`` package takes hundreds of milliseconds, which
+a worker scaled up from zero would pay before reading its first event. It
+is only imported on first use: other modules reach it through
+``k8s.client``, ``k8s.watch`` and ``k8s.ApiException``.
+"""
+import os
+import socket
+import logging
+import threading
+import time
+from urllib3.connection import HTTPConnection
+import metrics
+
+logger = logging.getLogger(__name__)
+
+K8S_POOL_SIZE = int(os.getenv("K8S_POOL_SIZE", "16"))  # parallel connections to the API server
+K8S_CONNECT_TIMEOUT = float(os.getenv("K8S_CONNECT_TIMEOUT", "5"))
+K8S_READ_TIMEOUT = float(os.getenv("K8S_READ_TIMEOUT", "30"))
+K8S_KEEPALIVE_IDLE = int(os.getenv("K8S_KEEPALIVE_IDLE", "30"))  # seconds before keepalive probes
+K8S_THROTTLE_RETRIES = int(os.getenv("K8S_THROTTLE_RETRIES", "3"))  # 429s retried inside request()
+
+REQUEST_TIMEOUT = (K8S_CONNECT_TIMEOUT, K8S_READ_TIMEOUT)
+
+_lock = threading.Lock()
+_config_loaded = False
+_api_client = None
+_core_v1 = None
+throttle = None  # set by the worker; None calls the API server unthrottled
+
+
+def _kubernetes():
+    """The kubernetes package, imported on first use (later calls hit sys.modules)"""
+    import kubernetes
+    return kubernetes
+
+
+def __getattr__(name):
+    """client, config, watch and ApiException, imported on first access"""
+    if name == "ApiException":
+        return _kubernetes().client.rest.ApiException
+    if name in ("client", "config", "watch"):
+        return getattr(_kubernetes(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_config():
+    """Load in-cluster config, falling back to kubeconfig. Only loads once."""
+    global _config_loaded
+    config = _kubernetes().config
+    with _lock:
+        if _config_loaded:
+            return True
+        try:
+            # Try in-cluster configuration first
+            config.load_incluster_config()
+            logger.info("Using in-cluster Kubernetes configuration")
+        except Exception as e:
+            logger.warning(f"In-cluster config failed: {e}")
+            try:
+                # Fall back to local kubeconfig
+                config.load_kube_config()
+                logger.info("Using local Kubernetes configuration")
+            except Exception as e:
+                logger.error(f"Failed to load Kubernetes config: {e}")
+                return False
+        _config_loaded = True
+        return True
+
+
+def _keepalive_options():
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, K8S_KEEPALIVE_IDLE))
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3))
+    return options
+
+
+def api_client():
+    """The shared ApiClient, created on first use"""
+    global _api_client
+    load_config()
+    client = _kubernetes().client
+    with _lock:
+        if _api_client is None:
+            configuration = client.Configuration.get_default_copy()
+            configuration.connection_pool_maxsize = K8S_POOL_SIZE
+            _api_client = client.ApiClient(configuration)
+            # Applies to every connection pool urllib3 creates from here on
+            _api_client.rest_client.pool_manager.connection_pool_kw["socket_options"] = _keepalive_options()
+            logger.info(f"Kubernetes client ready for {configuration.host} (pool size {K8S_POOL_SIZE})")
+        return _api_client
+
+
+def core_v1():
+    """CoreV1Api bound to the shared ApiClient"""
+    global _core_v1
+    if _core_v1 is None:
+        _core_v1 = _kubernetes().client.CoreV1Api(api_client())
+    return _core_v1
+
+
+def _describe(func):
+    """("create", "namespaced_pod") for CoreV1Api.create_namespaced_pod"""
+    name = func.__name__
+    if name.startswith("delete_collection_"):
+        return "deletecollection", name[len("delete_collection_"):]
+    verb, _, resource = name.partition("_")
+    return verb, resource
+
+
+def _retry_after(e):
+    """Seconds from an ApiException's Retry-After header, or None"""
+    value = e.headers.get("Retry-After") if e.headers else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None  # an HTTP date; the API server sends seconds
+
+
+def request(func, *args, **kwargs):
+    """Call a Kubernetes API method with the default request timeout, within the rate limit"""
+    kwargs.setdefault("_request_timeout", REQUEST_TIMEOUT)
+    verb, resource = _describe(func)
+    ApiException = _kubernetes().client.rest.ApiException
+    attempt = 0
+    while True:
+        if throttle:
+            throttle.acquire()
+        code = "error"
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            code = "ok"
+        except ApiException as e:
+            code = str(e.status)
+            if throttle:
+                throttle.record(e.status, _retry_after(e))
+            if e.status != 429 or not throttle or attempt >= K8S_THROTTLE_RETRIES:
+                raise
+            # Every replica is paused for the Retry-After now; acquire() waits it out
+            attempt += 1
+            logger.warning(f"{verb} {resource} throttled by the API server, retrying ({attempt}/{K8S_THROTTLE_RETRIES})")
+            continue
+        except Exception:
+            if throttle:
+                throttle.record(None)  # no answer at all
+            raise
+        finally:
+            metrics.K8S_LATENCY.labels(verb, resource, code).observe(time.perf_counter() - start)
+        if throttle:
+            throttle.record("ok")
+        return result
@@ -0,0 +1,141 @@
+import time
+import logging
+import threading
+import redis
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = "k8s:bucket"  # token bucket shared by every worker replica
+PAUSE_KEY = "k8s:paused"  # while it exists nobody calls the API server; value is the reason
+# Answers that mean the API server (or its priority-and-fairness filter) is
+# overloaded rather than that the request was wrong
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+# KEYS: bucket, pause
+# ARGV: rate (tokens/s), burst
+# Takes a token if one is available. Returns 0 when it did, otherwise the
+# ms to wait before asking again (the pause's remaining time while paused).
+# The clock is Redis' own, so replicas with skewed clocks refill the shared
+# bucket at the same rate.
+ACQUIRE_LUA = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+    return pause
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+# KEYS: pause
+# ARGV: duration (ms), reason
+# Starts or extends the pause; never shortens one already running.
+PAUSE_LUA = """
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class KubeThrottle:
+    """
+    Client-side limits for Kubernetes API calls, shared by every replica
+    through Redis.
+
+    acquire() takes a token from a bucket refilled at ``qps`` per second
+    (up to ``burst``) and sleeps until one is free; ``qps`` is the budget of
+    the whole worker deployment, not of one replica. A 429 pauses every
+    replica for its Retry-After. ``threshold`` overload answers in a row
+    open the circuit breaker: every replica pauses for ``cooldown``
+    seconds, doubling up to ``max_cooldown`` while the API server keeps
+    failing right after a pause, and the worker stops reading new events
+    while paused().
+
+    Redis errors fail open: an unreachable Redis never blocks Kubernetes
+    calls.
+    """
+
+    def __init__(self, r, qps, burst, threshold=5, cooldown=10, max_cooldown=30):
+        self.r = r
+        self.qps = qps
+        self.burst = max(1, burst)
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0  # overload answers in a row
+        self._acquire = r.register_script(ACQUIRE_LUA)
+        self._pause = r.register_script(PAUSE_LUA)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until this call may go to the API server"""
+        while True:
+            try:
+                if self.qps > 0:
+                    wait_ms = self._acquire(
+                        keys=[BUCKET_KEY, PAUSE_KEY], args=[self.qps, self.burst]
+                    )
+                else:
+                    wait_ms = max(0, self.r.pttl(PAUSE_KEY))
+            except redis.RedisError as e:
+                logger.warning(f"Kubernetes rate limiter unavailable, not throttling: {e}")
+                return
+            if not wait_ms:
+                return
+            metrics.K8S_THROTTLED.labels("wait").inc()
+            time.sleep(wait_ms / 1000)
+
+    def paused(self):
+        """Seconds the API server is still paused for (0 if it isn't)"""
+        try:
+            return max(0, self.r.pttl(PAUSE_KEY)) / 1000
+        except redis.RedisError:
+            return 0
+
+    def pause(self, seconds, reason):
+        try:
+            if self._pause(keys=[PAUSE_KEY], args=[max(1, int(seconds * 1000)), reason]):
+                metrics.K8S_THROTTLED.labels(reason).inc()
+                logger.warning(f"Pausing Kubernetes calls for {seconds:.1f}s ({reason})")
+        except redis.RedisError as e:
+            logger.warning(f"Could not pause Kubernetes calls: {e}")
+
+    def record(self, status, delay=None):
+        """
+        Feed back how a call went: an HTTP status, "ok", or None for no
+        answer at all (timeouts, refused connections). ``delay`` is the
+        Retry-After of a 429.
+        """
+        if status == 429:
+            self.pause(delay if delay is not None else 1, "retry_after")
+        overloaded = status is None or status in OVERLOAD_STATUSES
+        with self._lock:
+            if not overloaded:
+                self.failures = 0
+                self.cooldown = self.base_cooldown
+                return
+            self.failures += 1
+            if self.failures < self.threshold:
+                return
+            self.failures = 0
+            cooldown = self.cooldown
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        self.pause(cooldown, "breaker")
@@ -1,10 +1,24 @@
+import time
+STARTED_AT = time.monotonic()  # before the heavier imports, for time-to-first-event
 import os
 import redis
 import json
-import time
 import logging
-from kubernetes import client, config
-from kubernetes.client.rest import ApiException
+import random
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from prometheus_client import start_http_server
+import container_index as index
+import streams
+import metrics
+import k8s_client as k8s
+from pod_tracker import PodTracker, pod_status
+from warm_pool import WarmPool
+from reconciler import Reconciler
+from partitions import PartitionLeases, RENEW_LEASE_LUA
+from k8s_throttle import KubeThrottle
 
 # Configure logging
 logging.basicConfig(
@@ -13,182 +27,352 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Worker tuning
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "16"))  # events per XREADGROUP
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))  # containers handled in parallel
+THROUGHPUT_LOG_INTERVAL = int(os.getenv("THROUGHPUT_LOG_INTERVAL", "30"))  # seconds
+NAMESPACE = os.getenv("NAMESPACE", "sprout")
+# Fast start (scale from zero): read events as soon as Redis answers and
+# bring up Kubernetes, the pod tracker and the warm pool in the background
+WORKER_FAST_START = os.getenv("WORKER_FAST_START", "false").lower() in ("1", "true", "yes")
+REDIS_WAIT_TIMEOUT = float(os.getenv("REDIS_WAIT_TIMEOUT", "30"))  # seconds fast start waits for Redis
+
+# KEDA scales workers to zero this long after the streams go idle. Retries
+# parked in a retry set and events held back by a breaker pause don't show
+# up in the streams, so both waits are capped at half of it: the worker is
+# still running when they come due.
+SCALER_COOLDOWN = float(os.getenv("SCALER_COOLDOWN", "60"))
+
+def below_scaler_cooldown(name, value):
+    limit = SCALER_COOLDOWN / 2
+    if value > limit:
+        logger.warning(f"{name}={value:g}s would outlast the KEDA cooldown ({SCALER_COOLDOWN:g}s), using {limit:g}s")
+        return limit
+    return value
+
+# Retry / reclaim tuning
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))  # failures before dead-lettering
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))  # seconds, doubles per attempt
+RETRY_MAX_DELAY = below_scaler_cooldown("RETRY_MAX_DELAY", float(os.getenv("RETRY_MAX_DELAY", "30")))  # seconds
+RECLAIM_INTERVAL = float(os.getenv("RECLAIM_INTERVAL", "2"))  # seconds between retry/reclaim sweeps
+RECLAIM_MIN_IDLE_MS = int(os.getenv("RECLAIM_MIN_IDLE_MS", "60000"))  # pending this long = abandoned
+STREAM_TRIM_INTERVAL = float(os.getenv("STREAM_TRIM_INTERVAL", "60"))  # seconds between command stream trims
+STREAM_ARCHIVE_PATH = os.getenv("STREAM_ARCHIVE_PATH")  # JSON lines file for trimmed commands, unset = no archive
+COALESCE_LOOKAHEAD = int(os.getenv("COALESCE_LOOKAHEAD", "500"))  # backlog entries searched for deletes, 0 disables
+PARTITION_LEASE_TTL = float(os.getenv("PARTITION_LEASE_TTL", "30"))  # seconds a dead worker keeps its partitions
+PARTITION_REBALANCE_INTERVAL = float(os.getenv("PARTITION_REBALANCE_INTERVAL", "5"))  # seconds between rebalances
+
+# Warm pool: ready pods per image that creates claim instead of cold-starting
+MAX_CONTAINERS = int(os.getenv("MAX_CONTAINERS", "3"))  # same limit the API enforces
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "0"))  # pods per image, 0 disables the pool
+WARM_POOL_IMAGES = [i.strip() for i in os.getenv("WARM_POOL_IMAGES", "nginx:latest").split(",") if i.strip()]
+WARM_POOL_INTERVAL = float(os.getenv("WARM_POOL_INTERVAL", "5"))  # seconds between refills
+WARM_POOL_LOCK_KEY = "warm_pool:refill"
+# Kubernetes API limits, shared by every replica through Redis (see k8s_throttle.py)
+K8S_QPS = float(os.getenv("K8S_QPS", "50"))  # calls/sec across all workers, 0 = only pauses
+K8S_BURST = int(os.getenv("K8S_BURST", "100"))
+K8S_BREAKER_THRESHOLD = int(os.getenv("K8S_BREAKER_THRESHOLD", "5"))  # overload answers in a row
+K8S_BREAKER_COOLDOWN = float(os.getenv("K8S_BREAKER_COOLDOWN", "10"))  # seconds, doubles while it keeps failing
+K8S_BREAKER_MAX_COOLDOWN = below_scaler_cooldown(
+    "K8S_BREAKER_MAX_COOLDOWN", float(os.getenv("K8S_BREAKER_MAX_COOLDOWN", "30"))
+)
+
+# Reconciler: reaps pods the index no longer knows, settles containers without pods
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "60"))  # seconds between passes, 0 disables
+RECONCILE_LOCK_KEY = "containers:reconcile"
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"  # pod name in the cluster
+# Set on SIGTERM: stop reading, finish the batch in hand, hand the partitions back
+stopping = threading.Event()
+
 # Redis setup
 redis_host = os.getenv("REDIS_HOST", "redis-service")
+redis_port = int(os.getenv("REDIS_PORT", "6379"))
 redis_password = os.getenv("REDIS_PASSWORD")
 
-try:
-    r = redis.Redis(
-        host=redis_host, 
-        port=6379, 
-        db=0, 
-        password=redis_password,
-        socket_connect_timeout=5,
-        socket_timeout=5,
-        retry_on_timeout=True
-    )
-    # Test connection
-    r.ping()
-    logger.info(f"Successfully connected to Redis at {redis_host}")
-except redis.ConnectionError as e:
-    logger.error(f"Failed to connect to Redis at {redis_host}: {e}")
-    exit(1)
+# Connects lazily; health_check() or wait_for_redis() checks it's reachable
+r = redis.Redis(
+    host=redis_host, 
+    port=redis_port, 
+    db=0, 
+    password=redis_password,
+    socket_connect_timeout=5,
+    socket_timeout=5,
+    retry_on_timeout=True
+)
+
+k8s.throttle = KubeThrottle(
+    r, K8S_QPS, K8S_BURST, K8S_BREAKER_THRESHOLD, K8S_BREAKER_COOLDOWN, K8S_BREAKER_MAX_COOLDOWN
+)
+
+# Container index scripts (see container_index.py)
+set_status_script = r.register_script(index.SET_STATUS_LUA)
+update_fields_script = r.register_script(index.UPDATE_FIELDS_LUA)
+remove_script = r.register_script(index.REMOVE_LUA)
+backfill_script = r.register_script(index.BACKFILL_LUA)
+renew_lease_script = r.register_script(RENEW_LEASE_LUA)  # same lease primitive as the partitions
+
+def set_container_status(container_id, status, fields=None, only_if_indexed=False):
+    """
+    Write the container hash and move it to the matching status index.
+    Returns True if the container's status changed.
+    """
+    with metrics.redis_timer("set_status"):
+        applied, previous = set_status_script(
+            keys=[index.container_key(container_id), index.INDEX_KEY, index.VERSION_KEY],
+            args=index.status_args(container_id, status, time.time(), fields, only_if_indexed)
+        )
+    return bool(applied) and (previous or b"").decode() != status
+
+def update_container_fields(container_id, fields):
+    """Record details on an existing container without changing its status"""
+    with metrics.redis_timer("update_fields"):
+        return bool(update_fields_script(
+            keys=[index.container_key(container_id), index.VERSION_KEY],
+            args=index.field_args(fields)
+        ))
+
+def publish_status(update):
+    """Announce a status change on the status stream (never the command stream)"""
+    with metrics.redis_timer("publish_status"):
+        r.xadd(
+            streams.STATUS_STREAM,
+            update,
+            maxlen=streams.STATUS_STREAM_MAXLEN,
+            approximate=True
+        )
+
+def remove_container(container_id):
+    """Delete the container hash and drop it from the index"""
+    with metrics.redis_timer("remove"):
+        remove_script(
+            keys=[index.container_key(container_id), index.INDEX_KEY, index.VERSION_KEY],
+            args=[container_id]
+        )
+
+def backfill_index():
+    """
+    One-time migration: index container hashes written before the container
+    index existed. Without it they are missing from listings and quota, and
+    the reconciler would reap their pods as orphans.
+    """
+    if r.exists(index.BACKFILLED_KEY):
+        return
+    added = 0
+    prefix = index.container_key("")
+    for key in r.scan_iter(match=f"{prefix}*", count=1000):
+        container_id = key.decode()[len(prefix):]
+        added += backfill_script(
+            keys=[key, index.INDEX_KEY, index.VERSION_KEY], args=[container_id, time.time(), index.CONTAINER_TTL]
+        )
+    r.set(index.BACKFILLED_KEY, int(time.time()))
+    logger.info(f"Container index backfill done, {added} container(s) added")
 
 def setup_kubernetes():
     """Setup Kubernetes client with fallback options"""
-    try:
-        # Try in-cluster configuration first
-        config.load_incluster_config()
-        logger.info("Using in-cluster Kubernetes configuration")
-        return True
-    except Exception as e:
-        logger.warning(f"In-cluster config failed: {e}")
-        try:
-            # Fall back to local kubeconfig
-            config.load_kube_config()
-            logger.info("Using local Kubernetes configuration")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to load Kubernetes config: {e}")
-            return False
+    return k8s.load_config()
+
+def build_pod(pod_name, container_name, image, labels, annotations=None, env=None):
+    """Pod manifest shared by user containers and warm pool pods"""
+    return k8s.client.V1Pod(
+        api_version="v1",
+        kind="Pod",
+        metadata=k8s.client.V1ObjectMeta(
+            name=pod_name,
+            labels=labels,
+            annotations=annotations
+        ),
+        spec=k8s.client.V1PodSpec(
+            containers=[
+                k8s.client.V1Container(
+                    name=container_name.replace("_", "-").lower(),  # K8s name requirements
+                    image=image,
+                    image_pull_policy="IfNotPresent",  # Use local images if available
+                    ports=[k8s.client.V1ContainerPort(container_port=80)],
+                    resources=k8s.client.V1ResourceRequirements(
+                        requests={"memory": "64Mi", "cpu": "100m"},
+                        limits={"memory": "128Mi", "cpu": "200m"}
+                    ),
+                    # Add health checks
+                    readiness_probe=k8s.client.V1Probe(
+                        http_get=k8s.client.V1HTTPGetAction(
+                            path="/",
+                            port=80
+                        ),
+                        initial_delay_seconds=1,
+                        period_seconds=2,
+                        failure_threshold=2
+                    ),
+                    # Environment variables
+                    env=env
+                )
+            ],
+            restart_policy="Always",
+            # Add node selector for better placement (optional)
+            # node_selector={"kubernetes.io/arch": "amd64"}
+        )
+    )
+
+def build_warm_pod(pod_name, image, labels):
+    return build_pod(pod_name, "app", image, labels, env=[
+        k8s.client.V1EnvVar(name="CREATED_BY", value="k3-manager")
+    ])
 
 def create_k8s_container(container_data):
     """Create actual container/pod in Kubernetes"""
     container_id = container_data["container_id"]
     container_name = container_data.get("name", f"container-{container_id[:8]}")
     image = container_data.get("image", "nginx:latest")
+    if r.zscore(index.INDEX_KEY, container_id) is None:
+        # Deleted (or expired) before its create ran, e.g. the delete came
+        # through the priority lane; creating the pod now would only leak it
+        logger.info(f"Container {container_id} is gone, skipping its create")
+        return True
     logger.info(f"Creating container {container_id} with image {image}")
+    labels = {
+        "app": "container-manager",
+        "container-id": container_id,
+        "created-by": "k3-manager"
+    }
+    annotations = {
+        "created-at": container_data.get("created_at", ""),
+        "original-name": container_name
+    }
     try:
-        v1 = client.CoreV1Api()
-        # Define the pod spec with better resource management
-        pod_spec = client.V1Pod(
-            api_version="v1",
-            kind="Pod",
-            metadata=client.V1ObjectMeta(
-                name=f"pod-{container_id[:8]}",
-                labels={
-                    "app": "container-manager",
-                    "container-id": container_id,
-                    "created-by": "k3-manager"
-                },
-                annotations={
-                    "created-at": container_data.get("created_at", ""),
-                    "original-name": container_name
-                }
-            ),
-            spec=client.V1PodSpec(
-                containers=[
-                    client.V1Container(
-                        name=container_name.replace("_", "-").lower(),  # K8s name requirements
-                        image=image,
-                        image_pull_policy="IfNotPresent",  # Use local images if available
-                        ports=[client.V1ContainerPort(container_port=80)],
-                        resources=client.V1ResourceRequirements(
-                            requests={"memory": "64Mi", "cpu": "100m"},
-                            limits={"memory": "128Mi", "cpu": "200m"}
-                        ),
-                        # Add health checks
-                        readiness_probe=client.V1Probe(
-                            http_get=client.V1HTTPGetAction(
-                                path="/",
-                                port=80
-                            ),
-                            initial_delay_seconds=1,
-                            period_seconds=2,
-                            failure_threshold=2
-                        ),
-                        # Environment variables
-                        env=[
-                            client.V1EnvVar(name="CONTAINER_ID", value=container_id),
-                            client.V1EnvVar(name="CREATED_BY", value="k3-manager")
-                        ]
-                    )
-                ],
-                restart_policy="Always",
-                # Add node selector for better placement (optional)
-                # node_selector={"kubernetes.io/arch": "amd64"}
+        v1 = k8s.core_v1()
+        claimed = warm_pool.claim(image, labels, annotations) if warm_pool else None
+        if claimed is not None:
+            response = claimed
+            logger.info(f"Claimed warm pod {response.metadata.name} for container: {container_id}")
+        else:
+            pod_spec = build_pod(
+                f"pod-{container_id[:8]}", container_name, image, labels, annotations,
+                env=[
+                    k8s.client.V1EnvVar(name="CONTAINER_ID", value=container_id),
+                    k8s.client.V1EnvVar(name="CREATED_BY", value="k3-manager")
+                ]
             )
-        )
-        # Create the pod
-        namespace = os.getenv("NAMESPACE", "sprout")
-        logger.info(f"Creating pod in namespace: {namespace}")
-        response = v1.create_namespaced_pod(namespace=namespace, body=pod_spec)
-        logger.info(f"Successfully created pod: {response.metadata.name} for container: {container_id}")
-        # Update container status in Redis
-        container_info = {
+            # Create the pod
+            logger.info(f"Creating pod in namespace: {NAMESPACE}")
+            try:
+                response = k8s.request(v1.create_namespaced_pod, namespace=NAMESPACE, body=pod_spec)
+            except k8s.ApiException as e:
+                if e.status != 409:
+                    raise
+                # A previous attempt created the pod before failing; adopt it
+                response = k8s.request(v1.read_namespaced_pod, name=pod_spec.metadata.name, namespace=NAMESPACE)
+                logger.info(f"Pod {response.metadata.name} already exists, adopting it for container: {container_id}")
+            logger.info(f"Successfully created pod: {response.metadata.name} for container: {container_id}")
+        # Record the pod; its status is driven by the pod tracker from here on
+        update_container_fields(container_id, {
             "id": container_id,
-            "status": "running",
             "pod_name": response.metadata.name,
-            "namespace": namespace,
+            "namespace": NAMESPACE,
             "created_at": container_data.get("created_at", ""),
             "name": container_name,
             "image": image,
             "uid": str(response.metadata.uid)
-        }
-        r.hset(f"container:{container_id}", mapping=container_info)
-        # Also publish success event
-        r.xadd("container_events", {
-            "event_type": "container_status_update",
-            "container_id": container_id,
-            "status": "running",
-            "pod_name": response.metadata.name,
-            "timestamp": time.time()
         })
+        if claimed is not None:
+            # Already ready: report it now rather than waiting for the watch
+            status, detail = pod_status(response)
+            on_pod_change(container_id, status, {
+                "pod_name": response.metadata.name,
+                "phase": response.status.phase or "",
+                "node": response.spec.node_name or "",
+                "detail": detail,
+                "status_changed_at": time.time()
+            })
         return True
-    except ApiException as e:
+    except k8s.ApiException as e:
         error_details = {
             "status": e.status,
             "reason": e.reason,
             "body": e.body if e.body else "No additional details"
         }
         logger.error(f"Kubernetes API error for container {container_id}: {error_details}")
-        # Update status to failed with detailed error
-        r.hset(f"container:{container_id}", mapping={
-            "id": container_id,
-            "status": "failed",
-            "error": f"K8s API Error: {e.status} - {e.reason}",
-            "error_details": str(error_details),
-            "failed_at": time.time()
-        })
-        # Publish failure event
-        r.xadd("container_events", {
-            "event_type": "container_status_update",
-            "container_id": container_id,
-            "status": "failed",
-            "error": str(e),
-            "timestamp": time.time()
-        })
+        # Record the error; the container stays pending (and keeps its quota
+        # slot) while the event is retried, and is marked failed if it is
+        # dead-lettered
+        record_create_error(container_id, f"K8s API Error: {e.status} - {e.reason}", str(error_details))
         return False
     except Exception as e:
         logger.error(f"Unexpected error creating container {container_id}: {str(e)}")
-        # Update status to failed
-        r.hset(f"container:{container_id}", mapping={
-            "id": container_id,
-            "status": "failed",
-            "error": f"Unexpected error: {str(e)}",
-            "failed_at": time.time()
-        })
-        # Publish failure event
-        r.xadd("container_events", {
-            "event_type": "container_status_update",
-            "container_id": container_id,
-            "status": "failed",
-            "error": str(e),
-            "timestamp": time.time()
-        })
+        record_create_error(container_id, f"Unexpected error: {str(e)}")
         return False
 
+def record_create_error(container_id, error, details=""):
+    update_container_fields(container_id, {
+        "error": error,
+        "error_details": details,
+        "failed_at": time.time()
+    })
+    publish_status({
+        "event_type": "container_status_update",
+        "container_id": container_id,
+        "status": "pending",
+        "error": error,
+        "timestamp": time.time()
+    })
+
+def finish_deletion(container_id):
+    """Drop the container from Redis and announce it is gone"""
+    remove_container(container_id)
+    publish_status({
+        "event_type": "container_status_update",
+        "container_id": container_id,
+        "status": "deleted",
+        "timestamp": time.time()
+    })
+
+def mark_terminating(container_id):
+    set_container_status(container_id, "terminating", {
+        "deletion_requested_at": time.time()
+    }, only_if_indexed=True)
+    publish_status({
+        "event_type": "container_status_update",
+        "container_id": container_id,
+        "status": "terminating",
+        "timestamp": time.time()
+    })
+
+def mark_deletion_failed(container_id, error):
+    set_container_status(container_id, "deletion_failed", {
+        "error": error,
+        "failed_at": time.time()
+    }, only_if_indexed=True)
+    publish_status({
+        "event_type": "container_status_update",
+        "container_id": container_id,
+        "status": "deletion_failed",
+        "error": error,
+        "timestamp": time.time()
+    })
+
 def delete_k8s_container(container_id):
-    """Delete container/pod in Kubernetes with improved error handling"""
+    """
+    Request deletion of a container's pods. The container is marked
+    terminating before the delete goes out (an unscheduled pod can be gone
+    before the call returns) and the pod tracker removes it once the pods
+    are gone.
+    """
     logger.info(f"Starting deletion process for container {container_id}")
+    status, pod_name, error = r.hmget(index.container_key(container_id), "status", "pod_name", "error")
+    if status == b"pending" and not pod_name and not error:
+        # No create attempt has run yet (the delete came through the priority
+        # lane): nothing to delete, and the create is skipped once the
+        # container is gone. A pod left by an attempt that died before
+        # recording anything is reaped by the reconciler.
+        logger.info(f"Container {container_id} has no pod yet, removing it")
+        finish_deletion(container_id)
+        return True
     try:
-        v1 = client.CoreV1Api()
-        namespace = os.getenv("NAMESPACE", "sprout")
+        v1 = k8s.core_v1()
         # First, try to find the pod by looking for pods with the container-id label
         label_selector = f"container-id={container_id}"
         try:
-            pods = v1.list_namespaced_pod(
-                namespace=namespace,
+            pods = k8s.request(
+                v1.list_namespaced_pod,
+                namespace=NAMESPACE,
                 label_selector=label_selector
             )
             if not pods.items:
@@ -197,20 +381,13 @@ def delete_k8s_container(container_id):
                 logger.info(f"No pods found with label, trying pod name: {pod_name}")
                 # Check if pod exists before attempting deletion
                 try:
-                    pod = v1.read_namespaced_pod(name=pod_name, namespace=namespace)
+                    pod = k8s.request(v1.read_namespaced_pod, name=pod_name, namespace=NAMESPACE)
                     pods_to_delete = [pod]
-                except ApiException as e:
+                except k8s.ApiException as e:
                     if e.status == 404:
                         logger.warning(f"Pod {pod_name} not found, may have been already deleted")
                         # Clean up Redis entry anyway
-                        r.delete(f"container:{container_id}")
-                        # Publish deletion event
-                        r.xadd("container_events", {
-                            "event_type": "container_status_update",
-                            "container_id": container_id,
-                            "status": "deleted",
-                            "timestamp": time.time()
-                        })
+                        finish_deletion(container_id)
                         return True
                     else:
                         raise e
@@ -221,38 +398,27 @@ def delete_k8s_container(container_id):
             logger.error(f"Error finding pods for container {container_id}: {e}")
             return False
         # Delete all found pods
+        tracked = pod_tracker and pod_tracker.running
+        if tracked:
+            mark_terminating(container_id)
         deletion_successful = True
+        terminating = 0
         for pod in pods_to_delete:
             try:
                 # Delete with proper cleanup options
-                delete_options = client.V1DeleteOptions(
+                delete_options = k8s.client.V1DeleteOptions(
                     propagation_policy="Background",
                     grace_period_seconds=30
                 )
-                response = v1.delete_namespaced_pod(
+                k8s.request(
+                    v1.delete_namespaced_pod,
                     name=pod.metadata.name,
-                    namespace=namespace,
+                    namespace=NAMESPACE,
                     body=delete_options
                 )
+                terminating += 1
                 logger.info(f"Successfully initiated deletion of pod: {pod.metadata.name}")
-                # Wait a moment for the deletion to be processed
-                time.sleep(1)
-                # Verify deletion started
-                try:
-                    check_pod = v1.read_namespaced_pod(
-                        name=pod.metadata.name, 
-                        namespace=namespace
-                    )
-                    if check_pod.metadata.deletion_timestamp:
-                        logger.info(f"Pod {pod.metadata.name} is being terminated")
-                    else:
-                        logger.warning(f"Pod {pod.metadata.name} deletion may not have started")
-                except ApiException as e:
-                    if e.status == 404:
-                        logger.info(f"Pod {pod.metadata.name} successfully deleted")
-                    else:
-                        logger.error(f"Error checking pod deletion status: {e}")
-            except ApiException as e:
+            except k8s.ApiException as e:
                 if e.status == 404:
                     logger.info(f"Pod {pod.metadata.name} already deleted")
                 else:
@@ -262,112 +428,699 @@ def delete_k8s_container(container_id):
                 logger.error(f"Unexpected error deleting pod {pod.metadata.name}: {e}")
                 deletion_successful = False
         if deletion_successful:
-            # Clean up Redis state
-            r.delete(f"container:{container_id}")
-            # Publish deletion event
-            r.xadd("container_events", {
-                "event_type": "container_status_update",
-                "container_id": container_id,
-                "status": "deleted",
-                "timestamp": time.time()
-            })
+            if not (terminating and tracked):
+                finish_deletion(container_id)
+            # Otherwise the tracker sees the pods leave and calls finish_deletion
             logger.info(f"Successfully processed deletion for container {container_id}")
             return True
         else:
             logger.error(f"Some pods failed to delete for container {container_id}")
+            mark_deletion_failed(container_id, "Deletion error: some pods failed to delete")
             return False
     except Exception as e:
         logger.error(f"Unexpected error during deletion of container {container_id}: {e}")
         # Update Redis with error status
         try:
-            r.hset(f"container:{container_id}", mapping={
-                "status": "deletion_failed",
-                "error": f"Deletion error: {str(e)}",
-                "failed_at": time.time()
-            })
+            mark_deletion_failed(container_id, f"Deletion error: {str(e)}")
         except Exception as redis_error:
             logger.error(f"Failed to update Redis with deletion error: {redis_error}")
         return False
 
-def process_stream():
-    """Process container events from Redis stream with enhanced debugging"""
-    consumer_name = f"consumer-{os.getpid()}"
-    # Create consumer group if not exists
+# Pod tracker callbacks: the watch owns status from pod creation onwards
+# Batch commands (POST/DELETE /containers/batch)
+batch_executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="batch")
+
+def create_k8s_containers(event):
+    """
+    Create every container of a batch concurrently. Each one reports its own
+    status; the ones that failed are left in the event, so a retry only
+    repeats those.
+    """
+    containers = json.loads(event["containers"])
+    results = list(batch_executor.map(
+        lambda c: create_k8s_container({"container_id": c["id"], **c}), containers
+    ))
+    failed = [c for c, ok in zip(containers, results) if not ok]
+    if failed:
+        event["containers"] = json.dumps(failed)
+        logger.warning(f"Batch {event.get('batch_id')}: {len(failed)}/{len(containers)} creates failed")
+    return not failed
+
+def delete_k8s_containers(container_ids):
+    """
+    Delete a batch of containers with one list and one delete-collection
+    call instead of a lookup and delete per container. Containers without
+    pods are removed right away, the rest are marked terminating before the
+    delete goes out.
+    """
+    v1 = k8s.core_v1()
+    label_selector = f"app=container-manager,container-id in ({','.join(container_ids)})"
+    pods = k8s.request(v1.list_namespaced_pod, namespace=NAMESPACE, label_selector=label_selector)
+    with_pods = {pod.metadata.labels.get("container-id") for pod in pods.items if pod.metadata.labels}
+    tracked = pod_tracker and pod_tracker.running
+    for container_id in container_ids:
+        if container_id not in with_pods:
+            finish_deletion(container_id)
+        elif tracked:
+            mark_terminating(container_id)
+    if with_pods:
+        try:
+            k8s.request(
+                v1.delete_collection_namespaced_pod,
+                namespace=NAMESPACE,
+                label_selector=label_selector,
+                propagation_policy="Background",
+                grace_period_seconds=30
+            )
+        except Exception as e:
+            if tracked:
+                for container_id in with_pods:
+                    mark_deletion_failed(container_id, f"Deletion error: {str(e)}")
+            raise
+        logger.info(f"Deleting {len(pods.items)} pods for {len(with_pods)} containers")
+        if not tracked:
+            for container_id in with_pods:
+                finish_deletion(container_id)
+    return True
+
+def on_pod_change(container_id, status, fields):
+    if set_container_status(container_id, status, fields, only_if_indexed=True):
+        logger.info(f"Container {container_id} is {status} ({fields.get('detail') or fields.get('phase')})")
+        publish_status({
+            "event_type": "container_status_update",
+            "container_id": container_id,
+            "status": status,
+            "pod_name": fields["pod_name"],
+            "detail": fields["detail"],
+            "timestamp": time.time()
+        })
+
+def on_pod_deleted(container_id, pod_name):
+    status = r.hget(index.container_key(container_id), "status")
+    if status is None:
+        return  # already cleaned up
+    if status.decode() == "terminating":
+        logger.info(f"Pod {pod_name} is gone, container {container_id} deleted")
+        finish_deletion(container_id)
+    else:
+        logger.warning(f"Pod {pod_name} of container {container_id} was removed outside of the worker")
+        if set_container_status(container_id, "failed", {
+            "error": f"Pod {pod_name} was removed",
+            "failed_at": time.time()
+        }, only_if_indexed=True):
+            publish_status({
+                "event_type": "container_status_update",
+                "container_id": container_id,
+                "status": "failed",
+                "error": f"Pod {pod_name} was removed",
+                "timestamp": time.time()
+            })
+
+def on_ghost(container_id):
+    """Reconciler callback: the container is indexed with a pod, but it has none"""
+    pod_name = r.hget(index.container_key(container_id), "pod_name")
+    on_pod_deleted(container_id, pod_name.decode() if pod_name else "(unknown)")
+
+pod_tracker = None
+
+# Warm pool callbacks
+def pool_headroom():
+    """Pods MAX_CONTAINERS still allows on top of the active containers"""
+    with r.pipeline(transaction=False) as pipe:
+        for key in index.ACTIVE_STATUS_KEYS:
+            pipe.zcard(key)
+        return MAX_CONTAINERS - sum(pipe.execute())
+
+def hold_lease(key, lease_ms):
+    """Take or renew a lease on ``key``; True while this worker holds it"""
+    if r.set(key, WORKER_ID, nx=True, px=lease_ms):
+        return True
+    # Compare-and-renew in one step so a lease that expired and went to
+    # another worker in between is never extended
+    return bool(renew_lease_script(keys=[key], args=[WORKER_ID, lease_ms]))
+
+def may_refill_pool():
+    """
+    One worker owns pool maintenance at a time; the lease outlives a few
+    refill rounds so another worker takes over if the owner goes away.
+    """
+    return hold_lease(WARM_POOL_LOCK_KEY, int(WARM_POOL_INTERVAL * 3000))
+
+def may_reconcile():
+    """Same for the reconciler, so its two-pass checks stay on one worker"""
+    return hold_lease(RECONCILE_LOCK_KEY, int(RECONCILE_INTERVAL * 3000))
+
+warm_pool = None
+reconciler = None
+
+def decode_event(message):
+    return {k.decode(): v.decode() for k, v in message.items()}
+
+def event_container_ids(event):
+    """Containers a command acts on: one, or several for batch commands"""
+    event_type = event.get("event_type")
+    if event_type == "containers_created":
+        return [c["id"] for c in json.loads(event.get("containers") or "[]")]
+    if event_type == "containers_deleted":
+        return json.loads(event.get("container_ids") or "[]")
+    return [event["container_id"]] if event.get("container_id") else []
+
+def handle_event(message_id, event, stream=streams.EVENTS_STREAM):
+    """Run one command event read from ``stream``; ACK it on success, schedule a retry otherwise"""
+    event_type = event.get("event_type")
+    container_id = event.get("container_id")
+    logger.info(f"Processing event: {event_type} for container: {container_id}")
+    logger.debug(f"Full event data: {event}")
+    success = False
+    start = time.perf_counter()
     try:
-        r.xgroup_create("container_events", "keda-consumer", id="0", mkstream=True)
-        logger.info("Created consumer group 'keda-consumer'")
-    except redis.exceptions.ResponseError as e:
-        if "BUSYGROUP" in str(e):
-            logger.info("Consumer group 'keda-consumer' already exists")
+        if event_type == "container_created":
+            success = create_k8s_container(event)
+        elif event_type == "container_deleted":
+            if r.delete(f"{streams.CANCELLED_KEY_PREFIX}{container_id}"):
+                # coalesce() already cancelled the create, so there is no pod
+                logger.info(f"Create for {container_id} was cancelled, nothing to delete")
+                success = True
+            else:
+                logger.info(f"Starting deletion process for container: {container_id}")
+                success = delete_k8s_container(container_id)
+                logger.info(f"Deletion result for {container_id}: {success}")
+        elif event_type == "containers_created":
+            success = create_k8s_containers(event)
+        elif event_type == "containers_deleted":
+            success = delete_k8s_containers(json.loads(event["container_ids"]))
+        elif event_type == "container_status_update":
+            # Written to the command stream by older workers; now lives on the status stream
+            logger.debug(f"Skipping legacy status update in command stream: {message_id}")
+            success = True
         else:
-            logger.error(f"Failed to create consumer group: {e}")
-            return
-    logger.info(f"Starting container event processor with consumer: {consumer_name}")
-    # Setup Kubernetes connection
+            logger.warning(f"Unknown event type: {event_type}")
+            success = True  # Don't retry unknown events
+    except Exception as e:
+        logger.error(f"Error processing message {message_id}: {e}")
+        logger.error(f"Message content: {event}")
+    metrics.EVENT_DURATION.labels(event_type or "unknown", "ok" if success else "failed").observe(
+        time.perf_counter() - start
+    )
+    if success:
+        # Acknowledge successful processing
+        with metrics.redis_timer("ack"):
+            r.xack(stream, streams.CONSUMER_GROUP, message_id)
+        logger.info(f"Successfully processed and acknowledged event {message_id}")
+    else:
+        schedule_retry(message_id, event, stream)
+    throughput.record()
+    return success
+
+# Retries: failed events are ACKed and parked in their stream's due-time
+# sorted set, then re-enqueued on the same stream with exponential backoff.
+# After RETRY_MAX_ATTEMPTS failures they go to the dead-letter stream.
+
+# KEYS: retry set, events stream
+# ARGV: now, max events to move
+# Moves due events back onto the command stream; ZREM and XADD happen
+# together so concurrent workers never enqueue the same retry twice.
+PROMOTE_RETRIES_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    local fields = {}
+    for k, v in pairs(cjson.decode(member)) do
+        fields[#fields + 1] = k
+        fields[#fields + 1] = tostring(v)
+    end
+    redis.call('XADD', KEYS[2], '*', unpack(fields))
+    redis.call('ZREM', KEYS[1], member)
+end
+return #due
+"""
+promote_retries_script = r.register_script(PROMOTE_RETRIES_LUA)
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter so a burst of failures doesn't retry in lockstep"""
+    delay = RETRY_BASE_DELAY * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+    return min(delay, RETRY_MAX_DELAY)
+
+def schedule_retry(message_id, event, stream):
+    """Park a failed event for a delayed retry, or dead-letter it"""
+    attempts = int(event.get("attempts", 0)) + 1
+    if isinstance(message_id, bytes):
+        message_id = message_id.decode()
+    retry = {**event, "attempts": attempts, "first_message_id": event.get("first_message_id", message_id)}
+    if attempts >= RETRY_MAX_ATTEMPTS:
+        dead_letter(message_id, retry, f"failed {attempts} times", stream)
+        return
+    delay = retry_delay(attempts)
+    with r.pipeline() as pipe:
+        pipe.zadd(streams.retry_key(stream), {json.dumps(retry, sort_keys=True): time.time() + delay})
+        pipe.xack(stream, streams.CONSUMER_GROUP, message_id)
+        pipe.execute()
+    logger.warning(
+        f"Event {message_id} failed (attempt {attempts}/{RETRY_MAX_ATTEMPTS}), retrying in {delay:.1f}s"
+    )
+
+def dead_letter(message_id, event, reason, stream):
+    """Move an event that keeps failing to the dead-letter stream"""
+    with r.pipeline() as pipe:
+        pipe.xadd(
+            streams.DEAD_LETTER_STREAM,
+            {**event, "message_id": message_id, "stream": stream, "reason": reason, "dead_at": time.time()},
+            maxlen=streams.DEAD_LETTER_MAXLEN,
+            approximate=True
+        )
+        pipe.xack(stream, streams.CONSUMER_GROUP, message_id)
+        pipe.execute()
+    logger.error(f"Event {message_id} dead-lettered ({reason}): {event}")
+    status = {
+        "container_created": "failed", "containers_created": "failed",
+        "container_deleted": "deletion_failed", "containers_deleted": "deletion_failed"
+    }.get(event.get("event_type"))
+    if not status:
+        return
+    error = f"Gave up after {event.get('attempts')} attempts"
+    for container_id in event_container_ids(event):
+        if set_container_status(container_id, status, {"error": error, "failed_at": time.time()}, only_if_indexed=True):
+            publish_status({
+                "event_type": "container_status_update",
+                "container_id": container_id,
+                "status": status,
+                "error": error,
+                "timestamp": time.time()
+            })
+
+def promote_due_retries(stream):
+    """Re-enqueue retries whose backoff has elapsed"""
+    moved = promote_retries_script(
+        keys=[streams.retry_key(stream), stream],
+        args=[time.time(), WORKER_BATCH_SIZE]
+    )
+    if moved:
+        logger.info(f"Re-enqueued {moved} events for retry on {stream}")
+
+def reclaim_pending(consumer_name, stream):
+    """
+    Take over entries other consumers read but never ACKed (crashed or
+    scaled-down replicas). Entries delivered too often are dead-lettered
+    instead of being handed out again.
+    """
+    # Redis 7 replies [cursor, messages, deleted ids], Redis 6.2 [cursor, messages]
+    messages = r.xautoclaim(
+        stream,
+        streams.CONSUMER_GROUP,
+        consumer_name,
+        min_idle_time=RECLAIM_MIN_IDLE_MS,
+        start_id="0-0",
+        count=WORKER_BATCH_SIZE
+    )[1]
+    claimed = []
+    for message_id, message in messages:
+        if not message:
+            continue  # trimmed from the stream while pending
+        pending = r.xpending_range(
+            stream, streams.CONSUMER_GROUP, min=message_id, max=message_id, count=1
+        )
+        if pending and pending[0]["times_delivered"] > RETRY_MAX_ATTEMPTS:
+            dead_letter(message_id, decode_event(message), f"delivered {pending[0]['times_delivered']} times", stream)
+            continue
+        claimed.append((message_id, message))
+    if claimed:
+        logger.info(f"Reclaimed {len(claimed)} stale pending events from {stream}")
+    return claimed
+
+# Retention: the command stream is trimmed (approximately, so Redis only
+# drops whole nodes) below the oldest entry a consumer group may still need,
+# so a backlog is never cut short no matter how long it grows.
+
+def parse_stream_id(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    ms, _, seq = value.partition("-")
+    return int(ms), int(seq or 0)
+
+def stream_low_watermark(stream):
+    """
+    Oldest command entry still needed: per group, the oldest pending entry,
+    or the last delivered one when nothing is pending. None if the stream
+    has no groups yet.
+    """
+    floor = None
+    for group in r.xinfo_groups(stream):
+        needed = group["last-delivered-id"]
+        if group["pending"]:
+            needed = r.xpending(stream, group["name"])["min"]
+        needed = parse_stream_id(needed)
+        floor = needed if floor is None else min(floor, needed)
+    return floor
+
+def archive_entries(stream, min_id):
+    """Append entries below min_id that aren't archived yet to STREAM_ARCHIVE_PATH"""
+    cursor = r.get(streams.archive_cursor_key(stream))
+    start = f"({cursor.decode()}" if cursor else "-"
+    archived = 0
+    with open(STREAM_ARCHIVE_PATH, "a") as archive:
+        while True:
+            entries = r.xrange(stream, min=start, max=f"({min_id}", count=1000)
+            if not entries:
+                break
+            for message_id, message in entries:
+                entry = {"stream": stream, "id": message_id.decode(), **decode_event(message)}
+                archive.write(json.dumps(entry, separators=(",", ":")))
+                archive.write("\n")
+            start = f"({entries[-1][0].decode()}"
+            archived += len(entries)
+        archive.flush()
+        os.fsync(archive.fileno())
+    if archived:
+        r.set(streams.archive_cursor_key(stream), start[1:])
+    return archived
+
+def trim_events_stream(stream):
+    """Trim entries every consumer group is done with; called by the partition's owner"""
+    floor = stream_low_watermark(stream)
+    if not floor or floor == (0, 0):
+        return
+    min_id = f"{floor[0]}-{floor[1]}"
+    archived = archive_entries(stream, min_id) if STREAM_ARCHIVE_PATH else 0
+    with metrics.redis_timer("trim"):
+        trimmed = r.xtrim(stream, minid=min_id, approximate=True)
+    if trimmed or archived:
+        logger.info(f"Trimmed {trimmed} entries of {stream} below {min_id} (archived {archived})")
+
+def run_in_order(stream, entries):
+    """Handle one container's events sequentially, in stream order"""
+    for message_id, event in entries:
+        handle_event(message_id, event, stream)
+
+def coalesce(stream, messages):
+    """
+    Drop work a later event undoes before it reaches Kubernetes: a create
+    followed by a delete of the same container is cancelled outright, and
+    repeated deletes collapse into the first. A full batch means there is a
+    backlog, so creates are also matched against deletes up to
+    COALESCE_LOOKAHEAD entries further along the stream.
+
+    Only call this on fresh deliveries: a create that was already attempted
+    (a retry, or reclaimed from another consumer) may have left a pod behind
+    and must go through the normal delete.
+    Returns the messages that still need handling.
+    """
+    creates = {}  # container id -> create still waiting for a matching delete
+    deletes = set()
+    pairs, duplicates = [], []
+    for message_id, message in messages:
+        event = decode_event(message)
+        container_id = event.get("container_id")
+        event_type = event.get("event_type")
+        if not container_id:
+            continue
+        if event_type == "container_created" and not int(event.get("attempts", 0)):
+            creates[container_id] = message_id
+        elif event_type == "container_deleted":
+            if container_id in creates:
+                pairs.append((container_id, creates.pop(container_id), message_id))
+            elif container_id in deletes:
+                duplicates.append(message_id)
+            deletes.add(container_id)
+
+    ahead = []  # creates whose delete is still further back in the backlog
+    if creates and COALESCE_LOOKAHEAD > 0 and len(messages) >= WORKER_BATCH_SIZE:
+        last_id = messages[-1][0]
+        if isinstance(last_id, bytes):
+            last_id = last_id.decode()
+        for _, message in r.xrange(stream, min=f"({last_id}", count=COALESCE_LOOKAHEAD):
+            event = decode_event(message)
+            container_id = event.get("container_id")
+            if event.get("event_type") == "container_deleted" and container_id in creates:
+                ahead.append((container_id, creates.pop(container_id)))
+
+    if not (pairs or duplicates or ahead):
+        return messages
+    # Redis is cleaned up before the ACK: if we die in between, the events
+    # are reclaimed and handled normally
+    for container_id, _, _ in pairs:
+        finish_deletion(container_id)
+    skipped = [m for _, create_id, delete_id in pairs for m in (create_id, delete_id)] + duplicates
+    with r.pipeline() as pipe:
+        if skipped:
+            pipe.xack(stream, streams.CONSUMER_GROUP, *skipped)
+        # ACK the create before the cleanup so its delete falls back to the
+        # normal path (not a skipped one) if we die in between
+        for container_id, create_id in ahead:
+            pipe.xack(stream, streams.CONSUMER_GROUP, create_id)
+        pipe.execute()
+    for container_id, _ in ahead:
+        finish_deletion(container_id)
+        r.set(f"{streams.CANCELLED_KEY_PREFIX}{container_id}", 1, ex=streams.CANCELLED_TTL)
+    skipped += [create_id for _, create_id in ahead]
+
+    metrics.EVENTS_COALESCED.labels("create_delete").inc(2 * len(pairs) + len(ahead))
+    metrics.EVENTS_COALESCED.labels("duplicate_delete").inc(len(duplicates))
+    logger.info(
+        f"Coalesced {len(pairs) + len(ahead)} create/delete pairs and {len(duplicates)} duplicate deletes "
+        f"({len(skipped)} events ACKed without Kubernetes calls)"
+    )
+    skipped = set(skipped)
+    return [(message_id, message) for message_id, message in messages if message_id not in skipped]
+
+def group_by_container(messages):
+    """
+    Split a batch into lists that must run sequentially, keeping stream
+    order within each. Events sharing a container share a list; a batch
+    command joins the lists of every container it touches.
+    """
+    entries = [(message_id, decode_event(message)) for message_id, message in messages]
+    parent = list(range(len(entries)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_seen = {}  # container id -> position of its first event
+    for position, (_, event) in enumerate(entries):
+        for container_id in event_container_ids(event):
+            if container_id in first_seen:
+                parent[find(position)] = find(first_seen[container_id])
+            else:
+                first_seen[container_id] = position
+    groups = {}
+    for position, entry in enumerate(entries):
+        groups.setdefault(find(position), []).append(entry)
+    return list(groups.values())
+
+class Throughput:
+    """Thread-safe event counter that logs achieved events/sec periodically"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.count = 0
+        self.window_start = time.monotonic()
+
+    def record(self):
+        with self.lock:
+            self.count += 1
+
+    def maybe_report(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.window_start
+            if elapsed < self.interval:
+                return
+            count, self.count = self.count, 0
+            self.window_start = time.monotonic()
+        if count:
+            logger.info(f"Throughput: {count} events in {elapsed:.1f}s ({count / elapsed:.2f} events/sec)")
+
+throughput = Throughput(THROUGHPUT_LOG_INTERVAL)
+
+def process_batch(executor, batches):
+    """
+    Handle [(stream, messages)] read together. Containers run in parallel;
+    events for the same container stay sequential. The whole batch finishes
+    before the next read, so ordering also holds across batches, and a
+    container only ever lives on one partition stream.
+    """
+    groups = [(stream, group) for stream, messages in batches for group in group_by_container(messages)]
+    if len(groups) == 1:
+        run_in_order(*groups[0])
+        return
+    done, _ = wait([executor.submit(run_in_order, stream, group) for stream, group in groups])
+    for future in done:
+        if future.exception():
+            # Left un-ACKed; reclaim_pending picks it up once it goes stale
+            logger.error(f"Event handler failed: {future.exception()}")
+
+def process_lanes(executor, batches):
+    """process_batch, with everything read from priority lanes handled before the rest"""
+    urgent = [(stream, messages) for stream, messages in batches if streams.is_priority(stream)]
+    rest = [(stream, messages) for stream, messages in batches if not streams.is_priority(stream)]
+    for lane in (urgent, rest):
+        if any(messages for _, messages in lane):
+            process_batch(executor, lane)
+
+def start_kubernetes():
+    """Load the Kubernetes config and client, then start the pod tracker and warm pool"""
+    global pod_tracker, warm_pool, reconciler
     if not setup_kubernetes():
+        return False
+    k8s.core_v1()
+    pod_tracker = PodTracker(NAMESPACE, "app=container-manager", on_pod_change, on_pod_deleted).start()
+    if WARM_POOL_SIZE > 0 and WARM_POOL_IMAGES:
+        warm_pool = WarmPool(
+            NAMESPACE, WARM_POOL_IMAGES, WARM_POOL_SIZE,
+            build_warm_pod, pool_headroom, may_refill_pool, WARM_POOL_INTERVAL
+        ).start()
+    if RECONCILE_INTERVAL > 0:
+        reconciler = Reconciler(r, NAMESPACE, pod_tracker, may_reconcile, on_ghost, RECONCILE_INTERVAL).start()
+    logger.info(f"Kubernetes ready {time.monotonic() - STARTED_AT:.3f}s after start")
+    return True
+
+def start_kubernetes_or_exit():
+    if not start_kubernetes():
+        logger.critical("Failed to setup Kubernetes connection, exiting")
+        os._exit(1)  # from a background thread; let the pod restart
+
+def wait_for_redis():
+    """Ping Redis until it answers or REDIS_WAIT_TIMEOUT passes"""
+    deadline = time.monotonic() + REDIS_WAIT_TIMEOUT
+    delay = 0.05
+    while True:
+        try:
+            r.ping()
+            logger.info(f"Connected to Redis at {redis_host} {time.monotonic() - STARTED_AT:.3f}s after start")
+            return True
+        except redis.ConnectionError as e:
+            if time.monotonic() >= deadline:
+                logger.error(f"Failed to connect to Redis at {redis_host}: {e}")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+
+def request_stop(signum, frame):
+    logger.info(f"Received signal {signum}, stopping after the current batch")
+    stopping.set()
+
+def process_stream():
+    """Process container events from the partitions this worker owns in concurrent batches"""
+    consumer_name = WORKER_ID
+    # Create consumer groups if not exists
+    for stream in streams.COMMAND_STREAMS:
+        try:
+            r.xgroup_create(stream, streams.CONSUMER_GROUP, id="0", mkstream=True)
+            logger.info(f"Created consumer group 'keda-consumer' on {stream}")
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" in str(e):
+                logger.info(f"Consumer group 'keda-consumer' already exists on {stream}")
+            else:
+                logger.error(f"Failed to create consumer group: {e}")
+                return
+    # Before the reconciler starts, so it never sees unindexed containers
+    backfill_index()
+    logger.info(
+        f"Starting container event processor with consumer: {consumer_name} "
+        f"(batch size {WORKER_BATCH_SIZE}, concurrency {WORKER_CONCURRENCY}, "
+        f"{len(streams.EVENT_STREAMS)} partition(s), priority lanes {'on' if streams.PRIORITY_LANES else 'off'})"
+    )
+    if WORKER_FAST_START:
+        # Events that need Kubernetes before it is ready just wait for the client
+        threading.Thread(target=start_kubernetes_or_exit, name="k8s-start", daemon=True).start()
+    elif not start_kubernetes():
         logger.error("Failed to setup Kubernetes connection, exiting")
         return
+    first_event = True
+    executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="event")
+    # Partitions change hands only here, between batches, never during one
+    leases = PartitionLeases(r, consumer_name, streams.EVENT_STREAMS, PARTITION_LEASE_TTL).start()
     consecutive_errors = 0
     max_consecutive_errors = 5
-    while True:
+    last_rebalance = last_sweep = last_trim = 0
+    while not stopping.is_set():
         try:
-            # Read from stream with timeout
-            results = r.xreadgroup(
-                groupname="keda-consumer",
-                consumername=consumer_name,
-                streams={"container_events": ">"},
-                count=1,
-                block=1000  
-            )
+            throughput.maybe_report()
+            if time.monotonic() - last_rebalance >= PARTITION_REBALANCE_INTERVAL:
+                last_rebalance = time.monotonic()
+                owned = leases.rebalance()
+            else:
+                owned = leases.current()  # the renewal thread may have dropped one
+            if not owned:
+                # More workers than partitions; wait for one to come free
+                consecutive_errors = 0
+                stopping.wait(1)
+                continue
+            paused = k8s.throttle.paused()
+            if paused:
+                # The API server is overloaded: leave new events in the stream
+                # instead of failing them into the retry set
+                consecutive_errors = 0
+                stopping.wait(min(paused, 1))
+                continue
+            lanes = [lane for stream in owned for lane in streams.lanes(stream)]
+            results = None
+            if streams.PRIORITY_LANES:
+                # Deletes first: only look at creates once the priority lanes
+                # are empty. Deletes never outnumber creates, so creates
+                # can't starve.
+                results = r.xreadgroup(
+                    groupname=streams.CONSUMER_GROUP,
+                    consumername=consumer_name,
+                    streams={streams.priority_stream(stream): ">" for stream in owned},
+                    count=WORKER_BATCH_SIZE
+                )
+            if not results:
+                # Read from the owned streams with timeout
+                results = r.xreadgroup(
+                    groupname=streams.CONSUMER_GROUP,
+                    consumername=consumer_name,
+                    streams={lane: ">" for lane in lanes},
+                    count=WORKER_BATCH_SIZE,
+                    block=1000  
+                )
+            if time.monotonic() - last_sweep >= RECLAIM_INTERVAL:
+                last_sweep = time.monotonic()
+                claimed = []
+                for stream in lanes:
+                    promote_due_retries(stream)
+                    claimed.append((stream, reclaim_pending(consumer_name, stream)))
+                process_lanes(executor, claimed)
+            if time.monotonic() - last_trim >= STREAM_TRIM_INTERVAL:
+                last_trim = time.monotonic()
+                for stream in lanes:
+                    trim_events_stream(stream)
             if not results:
                 # No new messages, reset error counter
                 consecutive_errors = 0
                 continue
+            batches = []
             for stream, messages in results:
-                for message_id, message in messages:
-                    try:
-                        # Decode message
-                        event = {k.decode(): v.decode() for k, v in message.items()}
-                        event_type = event.get("event_type")
-                        container_id = event.get("container_id")
-                        logger.info(f"Processing event: {event_type} for container: {container_id}")
-                        logger.debug(f"Full event data: {event}")
-                        success = False
-                        if event_type == "container_created":
-                            success = create_k8s_container(event)
-                        elif event_type == "container_deleted":
-                            logger.info(f"Starting deletion process for container: {container_id}")
-                            success = delete_k8s_container(container_id)
-                            logger.info(f"Deletion result for {container_id}: {success}")
-                        else:
-                            logger.warning(f"Unknown event type: {event_type}")
-                            success = True  # Don't retry unknown events
-                        if success:
-                            # Acknowledge successful processing
-                            r.xack("container_events", "keda-consumer", message_id)
-                            logger.info(f"Successfully processed and acknowledged event {message_id}")
-                            consecutive_errors = 0
-                        else:
-                            logger.error(f"Failed to process event {message_id}, will retry later")
-                            # Don't acknowledge failed messages so they can be retried
-                    except Exception as e:
-                        logger.error(f"Error processing message {message_id}: {e}")
-                        logger.error(f"Message content: {message}")
-                        # Don't acknowledge failed messages so they can be retried
+                stream = stream.decode() if isinstance(stream, bytes) else stream
+                batches.append((stream, coalesce(stream, messages)))
+            process_lanes(executor, batches)
+            if first_event:
+                first_event = False
+                elapsed = time.monotonic() - STARTED_AT
+                metrics.TIME_TO_FIRST_EVENT.set(elapsed)
+                logger.info(f"First batch handled {elapsed:.3f}s after start")
+            consecutive_errors = 0
         except redis.ConnectionError as e:
             consecutive_errors += 1
             logger.error(f"Redis connection error ({consecutive_errors}/{max_consecutive_errors}): {e}")
             if consecutive_errors >= max_consecutive_errors:
                 logger.critical("Too many consecutive Redis errors, exiting")
                 break
-            time.sleep(min(consecutive_errors * 2, 30))  # Exponential backoff, max 30s
+            stopping.wait(min(consecutive_errors * 2, 30))  # Exponential backoff, max 30s
         except Exception as e:
             consecutive_errors += 1
             logger.error(f"Unexpected error in stream processing ({consecutive_errors}/{max_consecutive_errors}): {e}")
             if consecutive_errors >= max_consecutive_errors:
                 logger.critical("Too many consecutive errors, exiting")
                 break
-            time.sleep(5)
+            stopping.wait(5)
+    executor.shutdown(wait=True)
+    # Release the partitions now so other workers pick them up without
+    # waiting PARTITION_LEASE_TTL
+    leases.stop()
+    if stopping.is_set():
+        logger.info("Stopped: batch drained, partitions released")
 
 def health_check():
     """Perform health checks on startup"""
@@ -382,8 +1135,8 @@ def health_check():
     # Check Kubernetes
     try:
         if setup_kubernetes():
-            v1 = client.CoreV1Api()
-            namespaces = v1.list_namespace(limit=1)
+            v1 = k8s.core_v1()
+            namespaces = k8s.request(v1.list_namespace, limit=1)
             logger.info("â    Kubernetes connection: OK")
         else:
             logger.error("â    Kubernetes connection: FAILED")
@@ -391,18 +1144,23 @@ def health_check():
     except Exception as e:
         logger.error(f"â    Kubernetes connection: FAILED - {e}")
         return False
-    # Check stream exists
-    try:
-        stream_info = r.xinfo_stream("container_events")
-        logger.info(f"â    Container events stream: OK (length: {stream_info['length']})")
-    except Exception as e:
-        logger.warning(f"Container events stream not found, will be created: {e}")
+    # Check streams exist
+    for stream in streams.COMMAND_STREAMS:
+        try:
+            stream_info = r.xinfo_stream(stream)
+            logger.info(f"â    Container events stream {stream}: OK (length: {stream_info['length']})")
+        except Exception as e:
+            logger.warning(f"Container events stream {stream} not found, will be created: {e}")
     logger.info("Health checks completed")
     return True
 
 if __name__ == "__main__":
     logger.info("Starting K3 Container Manager Worker")
-    if health_check():
+    signal.signal(signal.SIGTERM, request_stop)
+    start_http_server(metrics.WORKER_METRICS_PORT)
+    logger.info(f"Metrics listening on :{metrics.WORKER_METRICS_PORT}")
+    # Fast start only waits for Redis; the full checks list namespaces first
+    if wait_for_redis() if WORKER_FAST_START else health_check():
         process_stream()
     else:
         logger.error("Health checks failed, exiting")
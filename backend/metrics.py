@@ -0,0 +1,130 @@
+"""Prometheus metrics shared by the API and the worker.
+
+The API serves them on ``/metrics``; the worker starts a small HTTP listener
+on WORKER_METRICS_PORT. Both processes import this module, so each one only
+ever exports the metrics it actually touches.
+
+A multi-process API server (API_WORKERS > 1) sets PROMETHEUS_MULTIPROC_DIR
+before starting its workers: each process writes its samples there and
+``exposition()`` merges them, so a scrape sees the whole server rather than
+whichever process answered.
+
+Stream gauges are refreshed by the API when it is scraped rather than by the
+worker: KEDA scales the worker to zero, and the backlog is exactly what we
+need to see while no worker is running.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Fast Redis calls and slow Kubernetes calls need different resolutions
+REDIS_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+K8S_BUCKETS = (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+# API
+REQUEST_LATENCY = Histogram(
+    "sprout_api_request_duration_seconds",
+    "Time to response headers per route",
+    ["method", "route", "status"]
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "sprout_api_rate_limit_rejections_total",
+    "Requests refused with 429 by the client rate limiter"
+)
+
+# Shared
+REDIS_LATENCY = Histogram(
+    "sprout_redis_duration_seconds",
+    "Redis round-trip time per operation (a script or pipeline is one round-trip)",
+    ["operation"],
+    buckets=REDIS_BUCKETS
+)
+
+# Worker
+EVENT_DURATION = Histogram(
+    "sprout_worker_event_duration_seconds",
+    "Time to handle one command event",
+    ["event_type", "outcome"],
+    buckets=K8S_BUCKETS
+)
+EVENTS_COALESCED = Counter(
+    "sprout_worker_events_coalesced_total",
+    "Command events ACKed without running because a later event cancels them",
+    ["reason"]
+)
+RECONCILED = Counter(
+    "sprout_worker_reconciled_total",
+    "Orphaned pods reaped and ghost containers settled by the reconciler",
+    ["action"]
+)
+TIME_TO_FIRST_EVENT = Gauge(
+    "sprout_worker_time_to_first_event_seconds",
+    "Time from process start until the first batch of events was handled"
+)
+K8S_LATENCY = Histogram(
+    "sprout_k8s_request_duration_seconds",
+    "Kubernetes API call latency",
+    ["verb", "resource", "code"],
+    buckets=K8S_BUCKETS
+)
+K8S_THROTTLED = Counter(
+    "sprout_k8s_throttled_total",
+    "Kubernetes calls held back by the shared rate limit (wait) and pauses started (retry_after, breaker)",
+    ["reason"]
+)
+
+# Streams (refreshed on scrape)
+# Any process may refresh them, so multi-process mode reports the latest write
+STREAM_LENGTH = Gauge(
+    "sprout_stream_length",
+    "Entries in a Redis stream",
+    ["stream"],
+    multiprocess_mode="mostrecent"
+)
+GROUP_LAG = Gauge(
+    "sprout_consumer_group_lag",
+    "Entries not yet delivered to the consumer group",
+    ["stream", "group"],
+    multiprocess_mode="mostrecent"
+)
+GROUP_PENDING = Gauge(
+    "sprout_consumer_group_pending",
+    "Entries delivered to the consumer group but not acknowledged",
+    ["stream", "group"],
+    multiprocess_mode="mostrecent"
+)
+
+
+@contextmanager
+def redis_timer(operation):
+    """Observe the wrapped Redis round-trip under ``operation``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REDIS_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+
+def record_stream(stream, length, groups):
+    """Update stream gauges from XLEN and XINFO GROUPS replies"""
+    STREAM_LENGTH.labels(stream).set(length)
+    for group in groups:
+        name = group["name"]
+        if isinstance(name, bytes):
+            name = name.decode()
+        GROUP_PENDING.labels(stream, name).set(group["pending"])
+        if group.get("lag") is not None:  # Redis 7+
+            GROUP_LAG.labels(stream, name).set(group["lag"])
+
+
+def exposition():
+    """Text exposition of this process's metrics, or of every process in multi-process mode"""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROCESS_DIR)
+        return generate_latest(registry)
+    return generate_latest()
@@ -0,0 +1,123 @@
+import math
+import time
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = "container_events:workers"  # live workers, scored by last heartbeat
+
+# KEYS: lease
+# ARGV: owner, ttl (ms)
+RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: lease
+# ARGV: owner
+RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(stream):
+    return f"{stream}:lease"
+
+
+class PartitionLeases:
+    """
+    Exclusive ownership of a fair share of the command stream partitions.
+
+    Each worker heartbeats into WORKERS_KEY and aims for
+    ceil(partitions / live workers) partitions. rebalance() claims free
+    partitions up to that share and gives back any above it; the worker
+    calls it between batches, so a partition never changes hands in the
+    middle of one. A background thread renews the leases it holds, so a slow
+    batch doesn't lose its partition; a worker that dies stops renewing and
+    its partitions are free again after ``ttl`` seconds.
+    """
+
+    def __init__(self, r, owner, streams, ttl=30):
+        self.r = r
+        self.owner = owner
+        self.streams = list(streams)
+        self.ttl = ttl
+        self.owned = []  # stream names this worker may read
+        self._renew = r.register_script(RENEW_LEASE_LUA)
+        self._release = r.register_script(RELEASE_LEASE_LUA)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="partition-leases", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Give every partition back right away instead of letting the leases expire"""
+        self._stop.set()
+        with self._lock:
+            for stream in self.owned:
+                self._release(keys=[lease_key(stream)], args=[self.owner])
+            self.owned = []
+        self.r.zrem(WORKERS_KEY, self.owner)
+
+    def current(self):
+        with self._lock:
+            return list(self.owned)
+
+    def run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.error(f"Partition lease renewal failed: {e}")
+
+    def heartbeat(self):
+        """Record this worker as live; returns the number of live workers"""
+        now = time.time()
+        with self.r.pipeline() as pipe:
+            pipe.zadd(WORKERS_KEY, {self.owner: now})
+            pipe.zremrangebyscore(WORKERS_KEY, "-inf", now - self.ttl)
+            pipe.zcard(WORKERS_KEY)
+            _, _, live = pipe.execute()
+        return max(1, live)
+
+    def renew(self):
+        self.heartbeat()
+        with self._lock:
+            lost = [
+                stream for stream in self.owned
+                if not self._renew(keys=[lease_key(stream)], args=[self.owner, int(self.ttl * 1000)])
+            ]
+            if lost:
+                # Expired (we were cut off for longer than ttl); someone else may own it now
+                self.owned = [stream for stream in self.owned if stream not in lost]
+                logger.warning(f"Lost partition lease(s): {', '.join(lost)}")
+
+    def rebalance(self):
+        """Claim or give back partitions to match the fair share; returns the owned streams"""
+        share = math.ceil(len(self.streams) / self.heartbeat())
+        with self._lock:
+            for stream in self.owned[share:]:
+                self._release(keys=[lease_key(stream)], args=[self.owner])
+                logger.info(f"Released partition {stream} (fair share is {share})")
+            del self.owned[share:]
+            if len(self.owned) < share:
+                # Start at a random partition so workers don't all race for the same ones
+                start = random.randrange(len(self.streams))
+                for stream in self.streams[start:] + self.streams[:start]:
+                    if len(self.owned) >= share:
+                        break
+                    if stream in self.owned:
+                        continue
+                    if self.r.set(lease_key(stream), self.owner, nx=True, px=int(self.ttl * 1000)):
+                        self.owned.append(stream)
+                        logger.info(f"Claimed partition {stream}")
+            return list(self.owned)
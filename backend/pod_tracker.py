@@ -0,0 +1,144 @@
+import threading
+import time
+import logging
+import k8s_client as k8s
+
+logger = logging.getLogger(__name__)
+
+WATCH_TIMEOUT = 300  # seconds per watch request before it is re-established
+RETRY_DELAY = 5  # seconds between attempts after a failed list/watch
+
+
+def pod_status(pod):
+    """
+    Map a pod to a container status.
+    Returns (status, detail) where detail explains non-ready states.
+    """
+    if pod.metadata.deletion_timestamp:
+        return "terminating", ""
+    phase = (pod.status.phase if pod.status else None) or "Pending"
+    detail = ""
+    for cs in (pod.status.container_statuses or []) if pod.status else []:
+        if cs.state and cs.state.waiting and cs.state.waiting.reason:
+            detail = cs.state.waiting.reason  # e.g. ContainerCreating, ImagePullBackOff
+            break
+    if phase == "Pending":
+        return ("starting" if pod.spec.node_name else "pending"), detail
+    if phase == "Running":
+        ready = any(
+            c.type == "Ready" and c.status == "True"
+            for c in (pod.status.conditions or [])
+        )
+        return ("running" if ready else "starting"), detail
+    if phase in ("Failed", "Succeeded"):
+        return "failed", detail or f"Pod {phase.lower()}"
+    return "pending", detail or phase
+
+
+class PodTracker:
+    """
+    Follows pods with a label selector through a list + watch and reports
+    phase/readiness transitions as they happen.
+
+    on_change(container_id, status, fields) is called whenever a pod's
+    derived status changes; on_deleted(container_id, pod_name) once the pod
+    is gone from the API server. Pods without a ``container-id`` label are
+    ignored. The last seen state of every pod is kept in ``pods``.
+    """
+
+    def __init__(self, namespace, label_selector, on_change, on_deleted):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.on_change = on_change
+        self.on_deleted = on_deleted
+        self.pods = {}  # pod name -> (container id, status)
+        self.resource_version = None
+        self.synced = threading.Event()
+        self._stop = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="pod-tracker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._watch:
+            self._watch.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        logger.info(f"Pod tracker watching '{self.label_selector}' in namespace {self.namespace}")
+        while not self._stop.is_set():
+            try:
+                v1 = k8s.core_v1()
+                if self.resource_version is None:
+                    self.relist(v1)
+                self._watch = k8s.watch.Watch()
+                for event in self._watch.stream(
+                    v1.list_namespaced_pod,
+                    namespace=self.namespace,
+                    label_selector=self.label_selector,
+                    resource_version=self.resource_version,
+                    allow_watch_bookmarks=True,
+                    timeout_seconds=WATCH_TIMEOUT,
+                    _request_timeout=(k8s.K8S_CONNECT_TIMEOUT, WATCH_TIMEOUT + 30)
+                ):
+                    pod = event["object"]
+                    self.resource_version = pod.metadata.resource_version
+                    if event["type"] == "BOOKMARK":
+                        continue
+                    self.handle(event["type"], pod)
+                    if self._stop.is_set():
+                        break
+            except k8s.ApiException as e:
+                if e.status == 410:
+                    logger.info("Pod watch expired, relisting")
+                    self.resource_version = None
+                    continue
+                logger.error(f"Pod watch failed: {e.status} - {e.reason}")
+                self._stop.wait(RETRY_DELAY)
+            except Exception as e:
+                logger.error(f"Pod watch error: {e}")
+                self._stop.wait(RETRY_DELAY)
+
+    def relist(self, v1):
+        """Full list to (re)build state; pods missing from it are reported gone"""
+        pods = k8s.request(v1.list_namespaced_pod, namespace=self.namespace, label_selector=self.label_selector)
+        seen = set()
+        for pod in pods.items:
+            seen.add(pod.metadata.name)
+            self.handle("ADDED", pod)
+        for name in list(self.pods):
+            if name not in seen:
+                container_id, _ = self.pods.pop(name)
+                self.on_deleted(container_id, name)
+        self.resource_version = pods.metadata.resource_version
+        self.synced.set()
+        logger.info(f"Pod tracker synced {len(seen)} pods at resourceVersion {self.resource_version}")
+
+    def handle(self, event_type, pod):
+        container_id = (pod.metadata.labels or {}).get("container-id")
+        if not container_id:
+            return
+        name = pod.metadata.name
+        if event_type == "DELETED":
+            self.pods.pop(name, None)
+            self.on_deleted(container_id, name)
+            return
+        status, detail = pod_status(pod)
+        if self.pods.get(name) == (container_id, status):
+            return  # e.g. probe or annotation updates that don't change status
+        self.pods[name] = (container_id, status)
+        self.on_change(container_id, status, {
+            "pod_name": name,
+            "phase": (pod.status.phase if pod.status else "") or "",
+            "node": pod.spec.node_name or "",
+            "detail": detail,
+            "status_changed_at": time.time()
+        })
@@ -0,0 +1,168 @@
+import time
+import logging
+import threading
+import k8s_client as k8s
+import container_index as index
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pods we created for containers; warm pool pods (pool=warm) are never reaped here
+POD_SELECTOR = "app=container-manager,created-by=k3-manager,!pool"
+DELETE_CHUNK = 50  # container ids per delete-collection selector
+# Statuses that mean the container had a pod; pending ones may still be queued
+POD_STATUSES = ("starting", "running", "terminating")
+
+
+class Reconciler:
+    """
+    Periodically diffs the container pods against the container index and
+    repairs what drifted apart:
+
+    - orphans: pods whose container is expired or no longer indexed (the
+      24h TTL ran out, or a create outlived its container). They are deleted
+      with one delete-collection call per DELETE_CHUNK containers.
+    - ghosts: containers indexed as starting/running/terminating without a
+      pod. on_ghost(container_id) settles them (the worker marks them failed,
+      or finishes a deletion).
+
+    Pods come from the pod tracker's cache when it is synced, otherwise from
+    a list at resourceVersion 0 (served from the API server's watch cache).
+    A pass is skipped while neither the pods' resourceVersion nor the index
+    version moved. Anything not yet expired must be seen in two consecutive
+    passes before it is acted on, so creates and deletes in flight are never
+    mistaken for drift.
+
+    may_run() says whether this replica reconciles right now, so only one
+    worker does it at a time.
+    """
+
+    def __init__(self, r, namespace, tracker, may_run, on_ghost, interval=60):
+        self.r = r
+        self.namespace = namespace
+        self.tracker = tracker
+        self.may_run = may_run
+        self.on_ghost = on_ghost
+        self.interval = interval
+        self.suspects = set()  # ("orphan" | "ghost", container id) seen in the last pass
+        self.last_seen = None  # (pods resourceVersion, index version) of the last clean pass
+        self._prune = r.register_script(index.PRUNE_EXPIRED_LUA)
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="reconciler", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        logger.info(f"Reconciler checking pods against the container index every {self.interval}s")
+        while not self._stop.wait(self.interval):
+            try:
+                if self.may_run():
+                    self.reconcile()
+                else:
+                    self.suspects = set()  # another worker's turn; start over if it comes back
+            except k8s.ApiException as e:
+                logger.error(f"Reconcile failed: {e.status} - {e.reason}")
+            except Exception as e:
+                logger.error(f"Reconcile error: {e}")
+
+    def pods(self):
+        """
+        ({container id: [names of its pods that aren't terminating]},
+        resourceVersion). Containers whose pods are all terminating map to
+        an empty list: they still have a pod, but there is nothing to reap.
+        """
+        by_container = {}
+        if self.tracker and self.tracker.running and self.tracker.synced.is_set():
+            resource_version = self.tracker.resource_version
+            for name, (container_id, status) in list(self.tracker.pods.items()):
+                names = by_container.setdefault(container_id, [])
+                if status != "terminating":
+                    names.append(name)
+            return by_container, resource_version
+        v1 = k8s.core_v1()
+        pods = k8s.request(
+            v1.list_namespaced_pod, namespace=self.namespace, label_selector=POD_SELECTOR, resource_version="0"
+        )
+        for pod in pods.items:
+            container_id = (pod.metadata.labels or {}).get("container-id")
+            if container_id:
+                names = by_container.setdefault(container_id, [])
+                if not pod.metadata.deletion_timestamp:
+                    names.append(pod.metadata.name)
+        return by_container, pods.metadata.resource_version
+
+    def indexed(self):
+        """(index version, every indexed id, ids in POD_STATUSES)"""
+        with self.r.pipeline(transaction=False) as pipe:
+            pipe.get(index.VERSION_KEY)
+            pipe.zrange(index.INDEX_KEY, 0, -1)
+            for status in POD_STATUSES:
+                pipe.zrange(index.status_key(status), 0, -1)
+            version, ids, *with_pods = pipe.execute()
+        decode = lambda values: {v.decode() if isinstance(v, bytes) else v for v in values}
+        return version, decode(ids), set().union(*(decode(v) for v in with_pods))
+
+    def reconcile(self):
+        """One pass; returns (pods reaped, ghosts settled)"""
+        # Expired containers leave the index (and the MAX_CONTAINERS count) now
+        # rather than whenever the API next prunes; their pods go right away
+        with metrics.redis_timer("prune"):
+            expired = {
+                v.decode() if isinstance(v, bytes) else v
+                for v in self._prune(keys=[index.VERSION_KEY, index.INDEX_KEY, *index.STATUS_KEYS], args=[time.time()])
+            }
+        pods, resource_version = self.pods()
+        version, ids, with_pods = self.indexed()
+        seen = (resource_version, version)
+        if not expired and not self.suspects and seen == self.last_seen:
+            return 0, 0
+
+        suspects = set()
+        reap, ghosts = [], []
+        for container_id, names in pods.items():
+            if not names:
+                continue  # already going away
+            if container_id in expired:
+                reap.append(container_id)
+                metrics.RECONCILED.labels("expired").inc()
+            elif container_id not in ids:
+                key = ("orphan", container_id)
+                if key in self.suspects:
+                    reap.append(container_id)
+                    metrics.RECONCILED.labels("orphan").inc()
+                else:
+                    suspects.add(key)
+        for container_id in with_pods - pods.keys():
+            key = ("ghost", container_id)
+            if key in self.suspects:
+                ghosts.append(container_id)
+            else:
+                suspects.add(key)
+        self.suspects = suspects
+        self.last_seen = None if suspects else seen
+
+        if reap:
+            self.delete_pods(reap)
+            logger.warning(f"Reaped {sum(len(pods[c]) for c in reap)} orphaned pod(s) of {len(reap)} container(s)")
+        for container_id in ghosts:
+            self.on_ghost(container_id)
+            metrics.RECONCILED.labels("ghost").inc()
+        if ghosts:
+            logger.warning(f"Settled {len(ghosts)} container(s) indexed without a pod")
+        return len(reap), len(ghosts)
+
+    def delete_pods(self, container_ids):
+        v1 = k8s.core_v1()
+        for start in range(0, len(container_ids), DELETE_CHUNK):
+            chunk = container_ids[start:start + DELETE_CHUNK]
+            k8s.request(
+                v1.delete_collection_namespaced_pod,
+                namespace=self.namespace,
+                label_selector=f"{POD_SELECTOR},container-id in ({','.join(chunk)})",
+                propagation_policy="Background",
+                grace_period_seconds=30
+            )
@@ -0,0 +1,93 @@
+"""Redis stream names shared by the API and the worker.
+
+Commands (``container_created`` / ``container_deleted``) go to EVENTS_STREAM,
+which the worker's consumer group reads and KEDA scales on. Status
+notifications produced by the worker go to STATUS_STREAM instead, so they are
+never read back as work and never count towards the lag KEDA sees. Anything
+that wants to follow status changes (the API, the UI) reads STATUS_STREAM
+without touching the command stream.
+
+With EVENT_PARTITIONS > 1 the command stream is split into
+``container_events:0`` .. ``container_events:N-1``; a container always
+hashes to the same partition and each partition is read by one worker at a
+time, so a container's commands stay in order however many replicas run.
+Retry sets and archive cursors exist per partition stream.
+
+With PRIORITY_LANES each partition stream also gets a priority lane,
+``<stream>:priority``, that deletes go to. The partition's owner reads the
+lane first, so a delete that frees a MAX_CONTAINERS slot never waits behind
+a backlog of creates; a create whose container was deleted in the meantime
+is skipped by the worker.
+"""
+import os
+import zlib
+
+EVENTS_STREAM = "container_events"
+CONSUMER_GROUP = "keda-consumer"
+
+# Every writer and reader must agree on this; drain the streams before
+# changing it
+EVENT_PARTITIONS = int(os.getenv("EVENT_PARTITIONS", "1"))
+
+
+def partition_stream(partition):
+    """Command stream of one partition (the plain stream when unpartitioned)"""
+    return EVENTS_STREAM if EVENT_PARTITIONS == 1 else f"{EVENTS_STREAM}:{partition}"
+
+
+EVENT_STREAMS = [partition_stream(p) for p in range(EVENT_PARTITIONS)]
+
+
+# Every writer and reader must agree on this too
+PRIORITY_LANES = os.getenv("PRIORITY_LANES", "false").lower() in ("1", "true", "yes")
+
+
+def priority_stream(stream):
+    return f"{stream}:priority"
+
+
+def is_priority(stream):
+    return stream.endswith(":priority")
+
+
+def lanes(stream):
+    """Streams the owner of a partition reads, highest priority first"""
+    return [priority_stream(stream), stream] if PRIORITY_LANES else [stream]
+
+
+# Every stream commands are written to: the partitions and their lanes
+COMMAND_STREAMS = [lane for stream in EVENT_STREAMS for lane in lanes(stream)]
+
+
+def events_stream(container_id, priority=False):
+    """Command stream for a container; ``priority`` picks its partition's priority lane"""
+    stream = EVENT_STREAMS[zlib.crc32(container_id.encode()) % EVENT_PARTITIONS]
+    return priority_stream(stream) if priority and PRIORITY_LANES else stream
+
+STATUS_STREAM = "container_status"
+# Notifications are only interesting while fresh, so keep a short,
+# approximately trimmed tail
+STATUS_STREAM_MAXLEN = int(os.getenv("STATUS_STREAM_MAXLEN", "1000"))
+
+# Failed commands wait in a sorted set scored by their due time and are put
+# back on their command stream when due; commands that keep failing end up
+# in the dead-letter stream for inspection.
+def retry_key(stream):
+    return f"{stream}:retry"
+
+
+DEAD_LETTER_STREAM = "container_events:dead"
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", "10000"))
+
+# A create the worker cancelled against a delete further back in the
+# backlog leaves this marker, so that delete is ACKed without touching
+# Kubernetes when it comes up
+CANCELLED_KEY_PREFIX = "container_events:cancelled:"
+CANCELLED_TTL = 3600
+
+# Command streams are never trimmed by length, which could drop commands no
+# worker has read yet. Workers trim them below the oldest entry any consumer
+# group still needs and can archive what they trim first; the cursor is the
+# last archived id, so replicas and restarts don't archive an entry twice.
+def archive_cursor_key(stream):
+    return f"{stream}:archived"
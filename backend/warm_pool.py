@@ -0,0 +1,142 @@
+import threading
+import uuid
+import logging
+import k8s_client as k8s
+from pod_tracker import pod_status
+
+logger = logging.getLogger(__name__)
+
+POOL_LABEL = "pool"
+POOL_SELECTOR = f"app=container-manager,{POOL_LABEL}=warm"
+
+
+class WarmPool:
+    """
+    Keeps up to ``size`` pre-created pods per image so a create can claim a
+    ready pod with a single PATCH instead of waiting for scheduling, image
+    pull and readiness.
+
+    Warm pods carry ``pool=warm`` and no ``container-id`` label, so the pod
+    tracker ignores them until they are claimed. A claim relabels the pod
+    with the pod's last seen resourceVersion as a precondition: if another
+    worker claimed (or the kubelet updated) it first, the API server answers
+    409 and the next candidate is tried.
+
+    make_pod(name, image, labels) builds the pod manifest; headroom() returns
+    how many more pods MAX_CONTAINERS allows, which bounds the whole pool;
+    may_refill() says whether this replica should create/delete pool pods
+    right now, so several workers don't all top the pool up at once.
+    """
+
+    def __init__(self, namespace, images, size, make_pod, headroom, may_refill, interval=5):
+        self.namespace = namespace
+        self.images = list(images)
+        self.size = size
+        self.make_pod = make_pod
+        self.headroom = headroom
+        self.may_refill = may_refill
+        self.interval = interval
+        self.ready = {image: [] for image in self.images}  # image -> [(pod name, resourceVersion)]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="warm-pool", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        logger.info(f"Warm pool keeping {self.size} pod(s) for {', '.join(self.images)}")
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except k8s.ApiException as e:
+                logger.error(f"Warm pool refill failed: {e.status} - {e.reason}")
+            except Exception as e:
+                logger.error(f"Warm pool refill error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refill(self):
+        """Refresh the claimable pods, then create or trim pool pods to the target"""
+        v1 = k8s.core_v1()
+        pods = k8s.request(v1.list_namespaced_pod, namespace=self.namespace, label_selector=POOL_SELECTOR)
+        by_image = {image: [] for image in self.images}
+        stale = []
+        for pod in pods.items:
+            if pod.metadata.deletion_timestamp:
+                continue
+            image = pod.spec.containers[0].image
+            status, _ = pod_status(pod)
+            if image not in by_image or status == "failed":
+                stale.append(pod)
+            else:
+                by_image[image].append((pod, status))
+        with self._lock:
+            self.ready = {
+                image: [(p.metadata.name, p.metadata.resource_version) for p, status in entries if status == "running"]
+                for image, entries in by_image.items()
+            }
+
+        if not self.may_refill():
+            return  # another worker manages the pool this round
+        for pod in stale:
+            self._delete(v1, pod.metadata.name)
+        budget = max(0, self.headroom())
+        for image in self.images:
+            entries = by_image[image]
+            target = min(self.size, budget)
+            budget -= target
+            for _ in range(target - len(entries)):
+                name = f"warm-{uuid.uuid4().hex[:8]}"
+                labels = {"app": "container-manager", "created-by": "k3-manager", POOL_LABEL: "warm"}
+                k8s.request(v1.create_namespaced_pod, namespace=self.namespace, body=self.make_pod(name, image, labels))
+                logger.info(f"Warm pool: created {name} for {image}")
+            if len(entries) > target:
+                # Over the headroom: trim, pods that aren't ready yet first
+                entries.sort(key=lambda entry: entry[1] == "running")
+                for pod, _ in entries[:len(entries) - target]:
+                    self._delete(v1, pod.metadata.name)
+
+    def _delete(self, v1, name):
+        try:
+            k8s.request(v1.delete_namespaced_pod, name=name, namespace=self.namespace)
+            logger.info(f"Warm pool: deleted {name}")
+        except k8s.ApiException as e:
+            if e.status != 404:
+                raise
+
+    def claim(self, image, labels, annotations):
+        """
+        Hand a ready pool pod over to a container by relabelling it.
+        Returns the claimed pod, or None if no ready pod could be claimed.
+        """
+        if image not in self.ready:
+            return None
+        v1 = k8s.core_v1()
+        try:
+            while True:
+                with self._lock:
+                    if not self.ready[image]:
+                        return None
+                    name, resource_version = self.ready[image].pop(0)
+                body = {"metadata": {
+                    "resourceVersion": resource_version,  # precondition: nobody claimed it since
+                    "labels": {**labels, POOL_LABEL: None},
+                    "annotations": annotations
+                }}
+                try:
+                    return k8s.request(v1.patch_namespaced_pod, name=name, namespace=self.namespace, body=body)
+                except k8s.ApiException as e:
+                    if e.status in (404, 409):
+                        logger.info(f"Warm pod {name} was taken or changed, trying the next one")
+                        continue
+                    raise
+        finally:
+            self._wake.set()  # top the pool back up
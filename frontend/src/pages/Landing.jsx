@@ -150,18 +150,54 @@ function Landing() {
     }
   };
 
-  // Initial Load and Polling
+  // Apply one pushed status update to the container list
+  const applyStatusUpdate = (update) => {
+    setContainers(prev => {
+      if (update.status === 'deleted') {
+        return prev.filter(c => c.id !== update.container_id);
+      }
+      const existing = prev.find(c => c.id === update.container_id);
+      if (!existing) {
+        if (!update.created_at) return prev;
+        return [...prev, {
+          id: update.container_id,
+          name: update.name,
+          image: update.image,
+          status: update.status,
+          created_at: update.created_at,
+          displayCreatedTime: formatCreatedTime(update.created_at)
+        }];
+      }
+      const { event_type, container_id, id, timestamp, ...fields } = update;
+      return prev.map(c => c.id === update.container_id ? { ...c, ...fields } : c);
+    });
+  };
+
+  // Initial Load, Live Updates and Polling
   useEffect(() => {
-    fetchContainers();
     fetchRateLimit();
 
-    // Poll containers every 15 seconds (60 requests/15min max)
-    const containerInterval = setInterval(fetchContainers, 15000);
+    // Status changes are pushed over SSE; the list is fetched on every
+    // (re)connect, including the first, so nothing missed while
+    // disconnected is lost
+    const events = new EventSource(`${API_BASE_URL}/containers/events`);
+    events.onopen = () => fetchContainers();
+    events.addEventListener('status', (e) => {
+      try {
+        applyStatusUpdate(JSON.parse(e.data));
+      } catch (err) {
+        console.warn('Bad status event:', err);
+      }
+    });
+
+    // Safety net only: poll containers every 2 minutes (8 requests/15min max)
+    const containerInterval = setInterval(fetchContainers, 120000);
 
     // Poll rate limit every 60 seconds (15 requests/15min max)
     const limitInterval = setInterval(fetchRateLimit, 60000);
 
     return () => {
+      events.close();
       clearInterval(containerInterval);
       clearInterval(limitInterval);
     };
@@ -250,7 +286,8 @@ function Landing() {
 
       const newContainer = await response.json();
       newContainer.displayCreatedTime = formatCreatedTime(newContainer.created_at);
-      setContainers(prev => [...prev, newContainer]);
+      // The pushed pending update may have added it already
+      setContainers(prev => prev.some(c => c.id === newContainer.id) ? prev : [...prev, newContainer]);
     } catch (err) {
       throw err;
     }